@@ -0,0 +1,202 @@
+import os
+import time
+import pickle
+import logging
+import threading
+from collections import OrderedDict
+
+# Ensure logs folder exists
+os.makedirs("logs", exist_ok=True)
+
+# Configure logging to write to file
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.FileHandler("logs/cache.log"),
+        logging.StreamHandler()
+    ]
+)
+
+# Cache settings
+API_CACHE_BACKEND = os.getenv("API_CACHE_BACKEND", "memory")  # "memory" or "redis"
+API_CACHE_REDIS_URL = os.getenv("API_CACHE_REDIS_URL", "redis://localhost:6379/0")
+API_CACHE_REDIS_PREFIX = os.getenv("API_CACHE_REDIS_PREFIX", "api_cache:")  # Namespace inside the shared database
+API_CACHE_TTL = float(os.getenv("API_CACHE_TTL", 30))  # Also bounds staleness after ETL loads
+API_CACHE_MAX_ENTRIES = int(os.getenv("API_CACHE_MAX_ENTRIES", 10_000))
+
+GENERATION_KEY = "messages:generation"
+
+
+class MemoryBackend:
+    """ In-process LRU store with a TTL per entry; also the stand-in for a shared backend in tests. """
+
+    def __init__(self, max_entries=API_CACHE_MAX_ENTRIES, clock=time.monotonic):
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._counters = {}  # Kept apart from the entries so LRU eviction never resets them
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._counters:
+                return self._counters[key]
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            expires_at = self._clock() + ttl if ttl else None
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._counters.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisBackend:
+    """ Shared backend for several API workers. Needs the optional `redis` package.
+
+    Every key is stored under prefix, so clear() and len() only touch this cache's keys.
+    """
+
+    def __init__(self, url=API_CACHE_REDIS_URL, prefix=API_CACHE_REDIS_PREFIX):
+        import redis  # Optional dependency, only needed for API_CACHE_BACKEND=redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=max(1, int(ttl)) if ttl else None)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def incr(self, key):
+        return self.client.incr(self.prefix + key)
+
+    def _keys(self):
+        return self.client.scan_iter(match=f"{self.prefix}*", count=1000)
+
+    def clear(self):
+        batch = []
+        for key in self._keys():
+            batch.append(key)
+            if len(batch) == 1000:
+                self.client.delete(*batch)
+                batch = []
+        if batch:
+            self.client.delete(*batch)
+
+    def __len__(self):
+        return sum(1 for _ in self._keys())
+
+
+class ResponseCache:
+    """ Read-through cache for message reads.
+
+    Single messages are cached under message:<message_id>. List pages are cached under a key
+    that includes a generation number; every write bumps the generation, which invalidates
+    all cached pages at once without having to find them (old pages age out through the LRU
+    and the TTL). Writes that bypass the API, such as ETL loads, show up within the TTL.
+    """
+
+    def __init__(self, backend=None, ttl=API_CACHE_TTL):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def generation(self):
+        """ Counter bumped by every invalidation. """
+        return self.backend.get(GENERATION_KEY) or 0
+
+    def set(self, key, value, generation=None):
+        """ Store value; pass the generation read before loading it from the database to skip the
+        write when a write was invalidated in between, so a stale row is never cached.
+        """
+        if generation is not None and generation != self.generation():
+            return
+        self.backend.set(key, value, self.ttl)
+
+    @staticmethod
+    def message_key(message_id):
+        return f"message:{message_id}"
+
+    def page_key(self, *params):
+        return f"messages:{self.generation()}:" + ":".join(str(param) for param in params)
+
+    def invalidate_message(self, *message_ids):
+        """ Drop the given messages and every cached list page. """
+        for message_id in message_ids:
+            self.backend.delete(self.message_key(message_id))
+        self.backend.incr(GENERATION_KEY)
+        self.invalidations += 1
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        """ Snapshot of the cache counters. """
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "evictions": getattr(self.backend, "evictions", None),
+            "ttl": self.ttl
+        }
+
+
+def create_cache():
+    """ Build the cache selected by API_CACHE_BACKEND. """
+    if API_CACHE_BACKEND == "redis":
+        logging.info(f"Using Redis response cache at {API_CACHE_REDIS_URL}")
+        return ResponseCache(RedisBackend(API_CACHE_REDIS_URL))
+    logging.info(f"Using in-memory response cache ({API_CACHE_MAX_ENTRIES} entries, {API_CACHE_TTL}s TTL)")
+    return ResponseCache(MemoryBackend(API_CACHE_MAX_ENTRIES))
+
+
+# Cache shared by the CRUD functions
+response_cache = create_cache()
@@ -1,7 +1,15 @@
 import os
+import json
+import time
+import base64
 import logging
-from sqlalchemy.orm import Session
+from datetime import datetime
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
 from API import models, schemas
+from API.cache import response_cache
 
 
 # Ensure logs folder exists
@@ -21,48 +29,244 @@ logging.basicConfig(
 logging.info("Starting CRUD operations definitions.")
 
 # CREATE operation for TelegramMessage
-def create_message(db: Session, message: schemas.TelegramMessageCreate):
+async def create_message(db: AsyncSession, message: schemas.TelegramMessageCreate):
     db_message = models.TelegramMessage(**message.dict())
     db.add(db_message)
-    db.commit()
-    db.refresh(db_message)
+    await db.commit()
+    await db.refresh(db_message)
+    response_cache.invalidate_message(db_message.message_id)
     logging.info(f"Created message with ID: {db_message.id}")
     return db_message
 
-# READ operation for a single TelegramMessage
-def get_message(db: Session, message_id: int):
-    db_message = db.query(models.TelegramMessage).filter(models.TelegramMessage.message_id == message_id).first()
+async def _find_message(db: AsyncSession, message_id: int):
+    result = await db.execute(select(models.TelegramMessage).where(models.TelegramMessage.message_id == message_id))
+    return result.scalars().first()
+
+# READ operation for a single TelegramMessage, served from the response cache when possible
+async def get_message(db: AsyncSession, message_id: int):
+    key = response_cache.message_key(message_id)
+    cached = response_cache.get(key)
+    if cached is not None:
+        return cached
+
+    generation = response_cache.generation()
+    db_message = await _find_message(db, message_id)
     if db_message:
         logging.info(f"Retrieved message with ID: {db_message.id}")
-    else:
-        logging.warning(f"Message with ID: {message_id} not found")
-    return db_message
+        # Cache the schema, not the ORM object, which belongs to this request's session
+        cached = schemas.TelegramMessage.model_validate(db_message)
+        response_cache.set(key, cached, generation)
+        return cached
+    logging.warning(f"Message with ID: {message_id} not found")
+    return None
 
-# READ operation for multiple TelegramMessages
-def get_messages(db: Session, skip: int = 0, limit: int = 10):
-    messages = db.query(models.TelegramMessage).offset(skip).limit(limit).all()
+# Opaque keyset pagination cursor: the last id of the previous page
+def encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"id": last_id}).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> int:
+    """ Raises ValueError for a cursor this API did not issue. """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(json.loads(base64.urlsafe_b64decode(padded))["id"])
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+# READ operation for a page of TelegramMessages, ordered by id
+async def get_messages_page(db: AsyncSession, limit: int = 10, cursor: str = None, skip: int = 0,
+                            channel_username: str = None, date_from: datetime = None, date_to: datetime = None):
+    """ Returns (messages, next_cursor); next_cursor is None on the last page.
+
+    With a cursor the page starts right after the previous one (WHERE id > last id), so every
+    page is an index range scan however deep it is. skip (OFFSET) is kept for old clients and
+    only used without a cursor. Pages are served from the response cache until the next write.
+    """
+    date_from, date_to = schemas.to_naive_utc(date_from), schemas.to_naive_utc(date_to)
+    key = response_cache.page_key(limit, cursor, skip, channel_username, date_from, date_to)
+    cached = response_cache.get(key)
+    if cached is not None:
+        return cached
+
+    query = select(models.TelegramMessage)
+    if channel_username:
+        query = query.where(models.TelegramMessage.channel_username == channel_username)
+    if date_from:
+        query = query.where(models.TelegramMessage.message_date >= date_from)
+    if date_to:
+        query = query.where(models.TelegramMessage.message_date < date_to)
+    query = query.order_by(models.TelegramMessage.id)
+    if cursor:
+        query = query.where(models.TelegramMessage.id > decode_cursor(cursor))
+    elif skip:
+        query = query.offset(skip)
+
+    # One extra row tells whether another page follows
+    messages = (await db.execute(query.limit(limit + 1))).scalars().all()
+    next_cursor = encode_cursor(messages[limit - 1].id) if len(messages) > limit else None
+    messages = [schemas.TelegramMessage.model_validate(message) for message in messages[:limit]]
     logging.info(f"Retrieved {len(messages)} messages")
+    response_cache.set(key, (messages, next_cursor))
+    return messages, next_cursor
+
+# READ operation for multiple TelegramMessages
+async def get_messages(db: AsyncSession, skip: int = 0, limit: int = 10):
+    messages, _ = await get_messages_page(db, limit=limit, skip=skip)
     return messages
 
+# Bulk upsert settings; a chunk is one existence check (IN list) plus one batched upsert
+BULK_CHUNK_SIZE = int(os.getenv("API_BULK_CHUNK_SIZE", 2000))
+UPSERT_COLUMNS = [
+    "channel_title", "channel_username", "message", "message_date",
+    "media_path", "emoji_used", "youtube_links"
+]
+
+_message_adapter = TypeAdapter(schemas.TelegramMessageCreate)
+_message_list_adapter = TypeAdapter(list[schemas.TelegramMessageCreate])
+
+def _error_text(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in error.errors())
+
+def load_bulk_items(body: bytes, ndjson: bool = False) -> list:
+    """ Parse a JSON array (or NDJSON lines) into a list of raw items, without validating them.
+
+    An NDJSON line that is not valid JSON becomes its ValueError, reported as invalid later.
+    Raises ValueError if the body is not a JSON array.
+    """
+    if ndjson:
+        items = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError as e:
+                items.append(e)
+        return items
+
+    try:
+        items = json.loads(body)
+    except ValueError as e:
+        raise ValueError(f"Body is not valid JSON: {e}") from e
+    if not isinstance(items, list):
+        raise ValueError("Body must be a JSON array of messages")
+    return items
+
+def validate_bulk_items(items: list):
+    """ Validate the items returned by load_bulk_items.
+
+    Returns (messages, failures): messages is a list of (index, TelegramMessageCreate), failures a
+    list of BulkItemStatus for the items that did not validate. All items are validated in one
+    pass; only a list with bad items is validated again item by item.
+    """
+    try:
+        return list(enumerate(_message_list_adapter.validate_python(items))), []
+    except ValidationError:
+        pass
+
+    messages, failures = [], []
+    for index, item in enumerate(items):
+        if isinstance(item, ValueError):
+            failures.append(schemas.BulkItemStatus(index=index, status="invalid", error=f"Invalid JSON: {item}"))
+            continue
+        try:
+            messages.append((index, _message_adapter.validate_python(item)))
+        except ValidationError as e:
+            message_id = item.get("message_id") if isinstance(item, dict) else None
+            failures.append(schemas.BulkItemStatus(
+                index=index, message_id=message_id if isinstance(message_id, int) else None,
+                status="invalid", error=_error_text(e)
+            ))
+    return messages, failures
+
+def _upsert_statement(db: AsyncSession):
+    """ INSERT ... ON CONFLICT (message_id) DO UPDATE for the session's dialect.
+
+    Built on the Core table and run as an executemany, so it compiles once (and is cached) instead
+    of compiling a bind parameter for every value of a multi-row VALUES clause.
+    """
+    insert = sqlite.insert if db.get_bind().dialect.name == "sqlite" else postgresql.insert
+    statement = insert(models.TelegramMessage.__table__)
+    return statement.on_conflict_do_update(
+        index_elements=[models.TelegramMessage.message_id],
+        set_={column: statement.excluded[column] for column in UPSERT_COLUMNS}
+    )
+
+# BULK CREATE/UPDATE operation for TelegramMessages
+async def bulk_upsert_messages(db: AsyncSession, messages: list, failures: list = ()):
+    """ Upsert validated (index, message) pairs on message_id in one transaction.
+
+    Each chunk is one batched INSERT ... ON CONFLICT DO UPDATE. If a message_id appears more than
+    once, the last item wins and the earlier ones are reported as "duplicate". Whether an item was
+    created or updated is decided by which message_ids existed before the write.
+    """
+    start_time = time.perf_counter()
+    statuses = {failure.index: failure for failure in failures}
+
+    latest = {}
+    for index, message in messages:
+        if message.message_id in latest:
+            statuses[latest[message.message_id][0]] = schemas.BulkItemStatus(
+                index=latest[message.message_id][0], message_id=message.message_id, status="duplicate",
+                error="Superseded by a later item with the same message_id"
+            )
+        latest[message.message_id] = (index, message)
+
+    created = updated = 0
+    try:
+        statement = _upsert_statement(db)
+        items = list(latest.values())
+        for start in range(0, len(items), BULK_CHUNK_SIZE):
+            chunk = items[start:start + BULK_CHUNK_SIZE]
+            message_ids = [message.message_id for _, message in chunk]
+            existing = set((await db.execute(
+                select(models.TelegramMessage.message_id).where(models.TelegramMessage.message_id.in_(message_ids))
+            )).scalars())
+            await db.execute(statement, [message.model_dump() for _, message in chunk])
+
+            for index, message in chunk:
+                status = "updated" if message.message_id in existing else "created"
+                statuses[index] = schemas.BulkItemStatus(index=index, message_id=message.message_id, status=status)
+            updated += len(existing)
+            created += len(chunk) - len(existing)
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        logging.error(f"Bulk upsert of {len(messages)} messages failed: {e}")
+        raise
+
+    if latest:
+        response_cache.invalidate_message(*latest)
+    elapsed = time.perf_counter() - start_time
+    logging.info(
+        f"Bulk upserted {created + updated} messages ({created} created, {updated} updated) "
+        f"in {elapsed:.2f}s ({(created + updated) / max(elapsed, 1e-9):.0f} rows/sec)."
+    )
+    return schemas.BulkUpsertResult(
+        received=len(messages) + len(failures), created=created, updated=updated, failed=len(failures),
+        items=[statuses[index] for index in sorted(statuses)]
+    )
+
 # UPDATE operation for TelegramMessage
-def update_message(db: Session, message_id: int, updated_message: schemas.TelegramMessageCreate):
-    db_message = db.query(models.TelegramMessage).filter(models.TelegramMessage.message_id == message_id).first()
+async def update_message(db: AsyncSession, message_id: int, updated_message: schemas.TelegramMessageCreate):
+    db_message = await _find_message(db, message_id)
     if db_message:
         for key, value in updated_message.dict().items():
             setattr(db_message, key, value)
-        db.commit()
-        db.refresh(db_message)
+        await db.commit()
+        await db.refresh(db_message)
+        response_cache.invalidate_message(message_id, db_message.message_id)
         logging.info(f"Updated message with ID: {db_message.id}")
     else:
         logging.warning(f"Message with ID: {message_id} not found")
     return db_message
 
 # DELETE operation for TelegramMessage
-def delete_message(db: Session, message_id: int):
-    db_message = db.query(models.TelegramMessage).filter(models.TelegramMessage.message_id == message_id).first()
+async def delete_message(db: AsyncSession, message_id: int):
+    db_message = await _find_message(db, message_id)
     if db_message:
-        db.delete(db_message)
-        db.commit()
+        await db.delete(db_message)
+        await db.commit()
+        response_cache.invalidate_message(message_id)
         logging.info(f"Deleted message with ID: {db_message.id}")
     else:
         logging.warning(f"Message with ID: {message_id} not found")
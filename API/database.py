@@ -1,9 +1,11 @@
 import os
 import logging
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
+from fastapi import HTTPException
 
 # Load environment variables from .env file
 load_dotenv()
@@ -18,12 +20,31 @@ DB_PORT = os.getenv("DB_PORT")
 # Define the Database URL using environment variables
 SQLALCHEMY_DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_DATABASE}"
 
-# Create the engine
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_DATABASE}"
+
+# Connection pool settings of the async engine used by the endpoints
+API_DB_POOL_SIZE = int(os.getenv("API_DB_POOL_SIZE", 10))
+API_DB_MAX_OVERFLOW = int(os.getenv("API_DB_MAX_OVERFLOW", 20))
+API_DB_POOL_TIMEOUT = int(os.getenv("API_DB_POOL_TIMEOUT", 30))
+API_DB_POOL_RECYCLE = int(os.getenv("API_DB_POOL_RECYCLE", 1800))
+
+# Create the engine (sync; used for create_all and scripts)
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
 
 # Create the session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine and session factory for the endpoints; sessions keep loaded objects usable after commit
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=API_DB_POOL_SIZE,
+    max_overflow=API_DB_MAX_OVERFLOW,
+    pool_timeout=API_DB_POOL_TIMEOUT,
+    pool_recycle=API_DB_POOL_RECYCLE,
+    pool_pre_ping=True
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 # Base class for our models
 Base = declarative_base()
 
@@ -53,5 +74,17 @@ def get_db():
         db.close()
         logging.info("Database session closed.")
 
+# Dependency to provide an async database session
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+        except HTTPException:
+            # Expected responses such as 404 or 400, not session errors
+            raise
+        except Exception as e:
+            logging.error(f"Error during async database session: {e}")
+            raise
+
 # Log the creation of the engine
 logging.info("Database engine created.")
@@ -0,0 +1,96 @@
+import io
+import os
+import csv
+import json
+import logging
+from datetime import datetime
+from sqlalchemy import select
+from API import database, models, schemas
+
+# Rows fetched per round trip from the server-side cursor
+EXPORT_BATCH_SIZE = int(os.getenv("API_EXPORT_BATCH_SIZE", 5000))
+
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+# Exportable tables by name
+EXPORT_TABLES = {
+    "messages": models.TelegramMessage.__table__,
+    "detections": models.DetectionResult.__table__
+}
+
+
+def select_columns(table_name, columns=None):
+    """ The table columns to export; columns is a comma-separated list, all columns when empty.
+
+    Raises ValueError for a column the table does not have.
+    """
+    table = EXPORT_TABLES[table_name]
+    if not columns:
+        return list(table.columns)
+    names = [name.strip() for name in columns.split(",") if name.strip()]
+    unknown = [name for name in names if name not in table.columns]
+    if unknown:
+        raise ValueError(f"Unknown columns for {table_name}: {', '.join(unknown)}")
+    return [table.columns[name] for name in names]
+
+
+def build_query(table_name, columns, **filters):
+    """ SELECT of the given columns ordered by id; filters with a None value are ignored.
+
+    Filters are equality on a column, except date_from/date_to (message_date range) and
+    min_confidence.
+    """
+    table = EXPORT_TABLES[table_name]
+    query = select(*columns)
+    for name, value in filters.items():
+        if value is None:
+            continue
+        if name == "date_from":
+            query = query.where(table.c.message_date >= schemas.to_naive_utc(value))
+        elif name == "date_to":
+            query = query.where(table.c.message_date < schemas.to_naive_utc(value))
+        elif name == "min_confidence":
+            query = query.where(table.c.confidence >= value)
+        else:
+            query = query.where(table.c[name] == value)
+    return query.order_by(table.c.id)
+
+
+def _to_text(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _format_batch(rows, names, fmt):
+    if fmt == "ndjson":
+        return "".join(
+            json.dumps({name: _to_text(value) for name, value in zip(names, row)}, default=str) + "\n"
+            for row in rows
+        )
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([_to_text(value) for value in row] for row in rows)
+    return buffer.getvalue()
+
+
+async def stream_export(query, names, fmt="ndjson", batch_size=EXPORT_BATCH_SIZE):
+    """ Yield the query's rows as NDJSON or CSV text, one chunk per batch of rows.
+
+    The session is opened here rather than taken from a request dependency, because the body
+    is sent after the endpoint returns. Rows come from a server-side cursor (session.stream with
+    yield_per), so only one batch is held in memory however large the table is.
+    """
+    if fmt == "csv":
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(names)
+        yield buffer.getvalue()
+
+    rows_sent = 0
+    async with database.AsyncSessionLocal() as db:
+        try:
+            result = await db.stream(query.execution_options(yield_per=batch_size))
+            async for rows in result.partitions():
+                rows_sent += len(rows)
+                yield _format_batch(rows, names, fmt)
+        except Exception as e:
+            logging.error(f"Export failed after {rows_sent} rows: {e}")
+            raise
+    logging.info(f"Exported {rows_sent} rows as {fmt}.")
@@ -1,9 +1,13 @@
 import os
 import logging
-from fastapi import FastAPI, Depends, HTTPException
+from datetime import datetime
+from typing import Optional
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session
-from API import crud, models, schemas, database
+from sqlalchemy.ext.asyncio import AsyncSession
+from API import crud, models, schemas, database, export
+from API.cache import response_cache
 
 # Initialize FastAPI application
 app = FastAPI()
@@ -34,42 +38,71 @@ logging.info("Starting FastAPI application.")
 # Create the database tables
 models.Base.metadata.create_all(bind=database.engine)
 
-# Dependency to provide a database session
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Dependency to provide an async database session
+get_db = database.get_async_db
 
 # CREATE endpoint for TelegramMessage
 @app.post("/messages/", response_model=schemas.TelegramMessage)
-def create_message(message: schemas.TelegramMessageCreate, db: Session = Depends(get_db)):
+async def create_message(message: schemas.TelegramMessageCreate, db: AsyncSession = Depends(get_db)):
     logging.info(f"Received request to create message: {message}")
-    return crud.create_message(db=db, message=message)
+    return await crud.create_message(db=db, message=message)
+
+# Largest number of messages accepted by one bulk request
+API_BULK_MAX_ITEMS = int(os.getenv("API_BULK_MAX_ITEMS", 50_000))
+
+# BULK CREATE/UPDATE endpoint for TelegramMessages
+# Body: a JSON array of messages, or one message per line with Content-Type: application/x-ndjson
+@app.post("/messages/bulk", response_model=schemas.BulkUpsertResult)
+async def bulk_upsert_messages(request: Request, db: AsyncSession = Depends(get_db)):
+    ndjson = "ndjson" in request.headers.get("content-type", "")
+    try:
+        items = crud.load_bulk_items(await request.body(), ndjson=ndjson)
+    except ValueError as e:
+        logging.warning(str(e))
+        raise HTTPException(status_code=400, detail=str(e))
+    # Reject an oversized request before spending time validating it
+    if len(items) > API_BULK_MAX_ITEMS:
+        logging.warning(f"Rejected bulk request with {len(items)} messages")
+        raise HTTPException(status_code=413, detail=f"At most {API_BULK_MAX_ITEMS} messages per request")
+    messages, failures = crud.validate_bulk_items(items)
+    logging.info(f"Received bulk request with {len(items)} messages ({len(failures)} invalid)")
+    return await crud.bulk_upsert_messages(db, messages, failures)
 
 # READ endpoint for a single TelegramMessage
 @app.get("/messages/{message_id}", response_model=schemas.TelegramMessage)
-def read_message(message_id: int, db: Session = Depends(get_db)):
+async def read_message(message_id: int, db: AsyncSession = Depends(get_db)):
     logging.info(f"Received request to read message with ID: {message_id}")
-    db_message = crud.get_message(db, message_id=message_id)
+    db_message = await crud.get_message(db, message_id=message_id)
     if db_message is None:
         logging.warning(f"Message with ID: {message_id} not found")
         raise HTTPException(status_code=404, detail="Message not found")
     return db_message
 
 # READ endpoint for multiple TelegramMessages
+# Keyset pagination: pass the X-Next-Cursor response header back as ?cursor= for the next page
 @app.get("/messages/", response_model=list[schemas.TelegramMessage])
-def read_messages(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    logging.info(f"Received request to read messages with skip: {skip} and limit: {limit}")
-    messages = crud.get_messages(db, skip=skip, limit=limit)
+async def read_messages(response: Response, skip: int = 0, limit: int = Query(10, ge=1, le=1000),
+                  cursor: Optional[str] = None, channel_username: Optional[str] = None,
+                  date_from: Optional[datetime] = None, date_to: Optional[datetime] = None,
+                  db: AsyncSession = Depends(get_db)):
+    logging.info(f"Received request to read messages with cursor: {cursor}, skip: {skip} and limit: {limit}")
+    try:
+        messages, next_cursor = await crud.get_messages_page(
+            db, limit=limit, cursor=cursor, skip=skip,
+            channel_username=channel_username, date_from=date_from, date_to=date_to
+        )
+    except ValueError as e:
+        logging.warning(str(e))
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return messages
 
 # UPDATE endpoint for TelegramMessage
 @app.put("/messages/{message_id}", response_model=schemas.TelegramMessage)
-def update_message(message_id: int, message: schemas.TelegramMessageCreate, db: Session = Depends(get_db)):
+async def update_message(message_id: int, message: schemas.TelegramMessageCreate, db: AsyncSession = Depends(get_db)):
     logging.info(f"Received request to update message with ID: {message_id}")
-    db_message = crud.update_message(db, message_id=message_id, updated_message=message)
+    db_message = await crud.update_message(db, message_id=message_id, updated_message=message)
     if db_message is None:
         logging.warning(f"Message with ID: {message_id} not found")
         raise HTTPException(status_code=404, detail="Message not found")
@@ -77,13 +110,51 @@ def update_message(message_id: int, message: schemas.TelegramMessageCreate, db:
 
 # DELETE endpoint for TelegramMessage
 @app.delete("/messages/{message_id}", response_model=schemas.TelegramMessage)
-def delete_message(message_id: int, db: Session = Depends(get_db)):
+async def delete_message(message_id: int, db: AsyncSession = Depends(get_db)):
     logging.info(f"Received request to delete message with ID: {message_id}")
-    db_message = crud.delete_message(db, message_id=message_id)
+    db_message = await crud.delete_message(db, message_id=message_id)
     if db_message is None:
         logging.warning(f"Message with ID: {message_id} not found")
         raise HTTPException(status_code=404, detail="Message not found")
     return db_message
 
+def _export_response(table_name, fmt, columns, **filters):
+    """ StreamingResponse of a table export; 400 for an unknown format or column. """
+    if fmt not in export.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(export.EXPORT_FORMATS)}")
+    try:
+        selected = export.select_columns(table_name, columns)
+    except ValueError as e:
+        logging.warning(str(e))
+        raise HTTPException(status_code=400, detail=str(e))
+    query = export.build_query(table_name, selected, **filters)
+    logging.info(f"Starting {fmt} export of {table_name} with filters: {filters}")
+    return StreamingResponse(
+        export.stream_export(query, [column.name for column in selected], fmt),
+        media_type=export.EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{table_name}.{fmt}"'}
+    )
+
+# EXPORT endpoint streaming the whole telegram_messages table (or a filtered part of it)
+@app.get("/export/messages")
+async def export_messages(format: str = "ndjson", columns: Optional[str] = None,
+                          channel_username: Optional[str] = None,
+                          date_from: Optional[datetime] = None, date_to: Optional[datetime] = None):
+    return _export_response("messages", format, columns, channel_username=channel_username,
+                            date_from=date_from, date_to=date_to)
+
+# EXPORT endpoint streaming the detection_results table
+@app.get("/export/detections")
+async def export_detections(format: str = "ndjson", columns: Optional[str] = None,
+                            file_name: Optional[str] = None, class_id: Optional[int] = None,
+                            min_confidence: Optional[float] = None):
+    return _export_response("detections", format, columns, file_name=file_name,
+                            class_id=class_id, min_confidence=min_confidence)
+
+# Hit/miss counters of the message read cache
+@app.get("/cache/stats")
+def read_cache_stats():
+    return response_cache.stats()
+
 # Log application ready
 logging.info("FastAPI application is ready.")
@@ -30,7 +30,7 @@ class TelegramMessage(Base):
     channel_username = Column(String, index=True)
     message_id = Column(Integer, unique=True, index=True)
     message = Column(Text)
-    message_date = Column(DateTime)
+    message_date = Column(DateTime, index=True)
     media_path = Column(String)
     emoji_used = Column(String)
     youtube_links = Column(String)
@@ -1,7 +1,8 @@
 import os
 import logging
-from pydantic import BaseModel
-from datetime import datetime
+from pydantic import BaseModel, field_validator
+from datetime import datetime, timezone
+from typing import Optional
 
 # Ensure logs folder exists
 os.makedirs("logs", exist_ok=True)
@@ -19,6 +20,12 @@ logging.basicConfig(
 # Log schema creation start
 logging.info("Starting schema definitions.")
 
+# message_date is a TIMESTAMP WITHOUT TIME ZONE holding UTC; asyncpg rejects aware datetimes for it
+def to_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
 # Define the schema for TelegramMessage
 class TelegramMessageBase(BaseModel):
     channel_title: str
@@ -33,6 +40,11 @@ class TelegramMessageBase(BaseModel):
     class Config:
         from_attributes = True
 
+    @field_validator("message_date")
+    @classmethod
+    def message_date_to_naive_utc(cls, value):
+        return to_naive_utc(value)
+
 logging.info("Defined TelegramMessageBase schema.")
 
 class TelegramMessageCreate(TelegramMessageBase):
@@ -48,6 +60,22 @@ class TelegramMessage(TelegramMessageBase):
 
 logging.info("Defined TelegramMessage schema.")
 
+# Define the schemas returned by the bulk upsert endpoint
+class BulkItemStatus(BaseModel):
+    index: int
+    message_id: Optional[int] = None
+    status: str  # "created", "updated", "duplicate" or "invalid"
+    error: Optional[str] = None
+
+class BulkUpsertResult(BaseModel):
+    received: int
+    created: int
+    updated: int
+    failed: int
+    items: list[BulkItemStatus]
+
+logging.info("Defined BulkUpsertResult schema.")
+
 # Define the schema for DetectionResult
 class DetectionResultBase(BaseModel):
     file_name: str
@@ -1,8 +1,13 @@
 import pandas as pd
+import numpy as np
+import io
 import os
 import logging
 import re
 import emoji
+import pyarrow.parquet as pq
+from concurrent.futures import ProcessPoolExecutor
+from parquet_store import MESSAGE_SCHEMA, open_dataset, read_dataset, is_parquet_path
 
 # Setup logging to file and console
 LOG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_cleaning.log")
@@ -15,12 +20,93 @@ logging.basicConfig(
     ]
 )
 
+# Parallel cleaning settings
+CLEANING_WORKERS = int(os.getenv("CLEANING_WORKERS", os.cpu_count() or 1))
+PARALLEL_MIN_ROWS = int(os.getenv("CLEANING_PARALLEL_MIN_ROWS", 50_000))  # Smaller frames are cleaned serially
+
+# Patterns are built once at import instead of on every call
+YOUTUBE_REGEX = r"https?://(?:www\.)?(?:youtube\.com|youtu\.be)/[^\s]+"
+YOUTUBE_PATTERN = re.compile(YOUTUBE_REGEX)
+
+EMOJI_CHARACTERS = frozenset(c for c in emoji.EMOJI_DATA if len(c) == 1)
+
+def _character_ranges(characters):
+    """Collapse characters into a regex class body of literal ranges, e.g. '©®‼⁉↔-↙'."""
+    ranges = []
+    for code in sorted(ord(c) for c in characters):
+        if ranges and code == ranges[-1][1] + 1:
+            ranges[-1][1] = code
+        else:
+            ranges.append([code, code])
+    return "".join(chr(a) if a == b else f"{chr(a)}-{chr(b)}" for a, b in ranges)
+
+# Used on pyarrow-backed strings, where pandas runs it with RE2 over the whole column
+NON_EMOJI_REGEX = f"[^{_character_ranges(EMOJI_CHARACTERS)}]+"
+
+# Per-string matcher: Python's re is slow on a class with ~1,400 astral characters, so a cheap
+# candidate pattern skips ASCII and Ethiopic text and the frozenset confirms each candidate
+_LOW_EMOJIS = "".join(sorted(re.escape(c) for c in EMOJI_CHARACTERS if ord(c) < 0x2000))
+EMOJI_CANDIDATE_PATTERN = re.compile(f"[{_LOW_EMOJIS}\u2000-\U0010ffff]+")
+
+def find_emojis(text):
+    """Return the emojis of text concatenated in order ('' if there are none)."""
+    candidates = "".join(EMOJI_CANDIDATE_PATTERN.findall(text))
+    return "".join(filter(EMOJI_CHARACTERS.__contains__, candidates))
+
+def _clean_shard(shard):
+    """Process pool entry point: clean one shard of a frame."""
+    return DataCleaning().clean_dataframe(shard)
+
+class SeenIds:
+    """Compact record of message IDs already emitted, kept as one sorted int64 NumPy array
+    (8 bytes per ID instead of a Python int in a set)."""
+
+    def __init__(self):
+        self.ids = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def take_new(self, ids):
+        """Return a mask of the IDs seen for the first time (also within ids) and remember them."""
+        ids = np.asarray(ids, dtype=np.int64)
+        first_in_chunk = np.zeros(len(ids), dtype=bool)
+        first_in_chunk[np.unique(ids, return_index=True)[1]] = True
+
+        positions = np.searchsorted(self.ids, ids)
+        already_seen = np.zeros(len(ids), dtype=bool)
+        in_range = positions < len(self.ids)
+        already_seen[in_range] = self.ids[positions[in_range]] == ids[in_range]
+
+        new = first_in_chunk & ~already_seen
+        new_ids = np.sort(ids[new])
+        self.ids = np.insert(self.ids, np.searchsorted(self.ids, new_ids), new_ids)  # Linear merge
+        return new
+
+class _ByteRange(io.RawIOBase):
+    """Read-only view of the next `length` bytes of an open binary file."""
+
+    def __init__(self, f, length):
+        self.f = f
+        self.remaining = length
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.f.read(min(len(buffer), self.remaining))
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
 class DataCleaning:
     def __init__(self):
         self.dataframes = []
     
     def load_data(self, path):
         logging.info("Loading the data")
+        if is_parquet_path(path):
+            return self.load_parquet(path)
         try:
             df = pd.read_csv(path)
             self.dataframes.append(df)
@@ -29,6 +115,21 @@ class DataCleaning:
             logging.error(f"Error occurred while loading the data: {e}")
             return None
 
+    def load_parquet(self, path, columns=None, filters=None):
+        """Load raw messages from the partitioned Parquet dataset.
+
+        Only the requested columns are read, and filters such as [("channel", "=", "CheMed123")]
+        or [("date", ">=", "2024-01-01")] skip partitions that cannot match.
+        """
+        logging.info(f"Loading Parquet data from '{path}'")
+        try:
+            df = read_dataset(path, MESSAGE_SCHEMA, columns=columns or MESSAGE_SCHEMA.names, filters=filters)
+            self.dataframes.append(df)
+            return df
+        except Exception as e:
+            logging.error(f"Error occurred while loading the Parquet data: {e}")
+            return None
+
     def merge(self, dataframes=None):
         try:
             logging.info("Merging dataframes...")
@@ -97,25 +198,47 @@ class DataCleaning:
     
     def extract_emojis(self, text):
         """Extract emojis from text, return 'No emoji' if none found."""
-        emojis = ''.join(c for c in text if c in emoji.EMOJI_DATA)
+        emojis = find_emojis(text)
         return emojis if emojis else "No emoji"
 
     def extract_youtube_links(self, text):
         """Extract YouTube links from text, return 'No YouTube link' if none found."""
-        youtube_pattern = r"(https?://(?:www\.)?(?:youtube\.com|youtu\.be)/[^\s]+)"
-        links = re.findall(youtube_pattern, text)
+        links = YOUTUBE_PATTERN.findall(text)
         return ', '.join(links) if links else "No YouTube link"
 
     def remove_youtube_links(self, text):
         """Remove YouTube links from the message text."""
-        youtube_pattern = r"https?://(?:www\.)?(?:youtube\.com|youtu\.be)/[^\s]+"
-        return re.sub(youtube_pattern, '', text).strip()
+        return YOUTUBE_PATTERN.sub('', text).strip()
 
     def clean_text(self, text):
         """Clean text by removing unwanted characters and normalizing."""
         text = self.remove_youtube_links(text)
         return text.strip()
 
+    def extract_text_features(self, messages):
+        """Build the cleaned message, emoji_used and youtube_links columns from raw messages.
+
+        The column is converted to pyarrow-backed strings so the regex replace, contains and
+        strip calls run as Arrow (RE2) kernels over the whole column instead of per row.
+        """
+        messages = messages.astype(str).astype("string[pyarrow]")
+
+        # Links are rare, so only rows that contain one go through findall
+        youtube_links = pd.Series("No YouTube link", index=messages.index, dtype=object)
+        has_link = messages.str.contains(YOUTUBE_REGEX, regex=True)
+        if has_link.any():
+            youtube_links[has_link] = messages[has_link].astype(object).map(
+                lambda text: ", ".join(YOUTUBE_PATTERN.findall(text))
+            )
+
+        cleaned = messages.str.replace(YOUTUBE_REGEX, "", regex=True).str.strip()
+        emoji_used = cleaned.str.replace(NON_EMOJI_REGEX, "", regex=True)
+        return pd.DataFrame({
+            "message": cleaned,
+            "emoji_used": emoji_used.mask(emoji_used == "", "No emoji"),
+            "youtube_links": youtube_links
+        }, index=messages.index)
+
     def clean_dataframe(self, df):
         """Perform all cleaning and standardization steps while avoiding SettingWithCopyWarning."""
         try:
@@ -130,28 +253,22 @@ class DataCleaning:
             # Convert 'ID' to integer for PostgreSQL BIGINT compatibility
             df.loc[:, 'ID'] = pd.to_numeric(df['ID'], errors="coerce").fillna(0).astype(int)
 
-            # Fill missing values
-            df.loc[:, 'Message'] = df['Message'].fillna("No Message")
-            df.loc[:, 'Media Path'] = df['Media Path'].fillna("No Media")
+            # Fill missing values (assigned whole, since an all-empty column in a chunk is float64)
+            df['Message'] = df['Message'].fillna("No Message")
+            df['Media Path'] = df['Media Path'].fillna("No Media")
             logging.info("Missing values filled.")
 
             # Standardize text columns
             df.loc[:, 'Channel Title'] = df['Channel Title'].str.strip()
             df.loc[:, 'Channel Username'] = df['Channel Username'].str.strip()
-            df.loc[:, 'Message'] = df['Message'].apply(self.clean_text)
             df.loc[:, 'Media Path'] = df['Media Path'].str.strip()
-            logging.info("Text columns standardized.")
-
-            # Extract emojis and store them in a new column
-            df.loc[:, 'emoji_used'] = df['Message'].apply(self.extract_emojis)
-            logging.info("Emojis extracted and stored in 'emoji_used' column.")
-            
-            # Extract YouTube links into a separate column
-            df.loc[:, 'youtube_links'] = df['Message'].apply(self.extract_youtube_links)
-            logging.info("YouTube links extracted and stored in 'youtube_links' column.")
 
-            # Remove YouTube links from message text
-            df.loc[:, 'Message'] = df['Message'].apply(self.remove_youtube_links)
+            # Clean messages and extract emojis and YouTube links (taken before they are removed)
+            features = self.extract_text_features(df['Message'])
+            df['Message'] = features['message']
+            df['emoji_used'] = features['emoji_used']
+            df['youtube_links'] = features['youtube_links']
+            logging.info("Text columns standardized, emojis and YouTube links extracted.")
 
             # Rename columns to match PostgreSQL schema
             df = df.rename(columns={
@@ -171,6 +288,102 @@ class DataCleaning:
             logging.error(f"Data cleaning error: {e}")
             raise
     
+    def clean_dataframe_parallel(self, df, workers=None, min_rows=PARALLEL_MIN_ROWS):
+        """Run clean_dataframe on contiguous shards of df in a process pool.
+
+        IDs are deduplicated before sharding so a duplicate can't survive in two shards, and
+        shards are reassembled in their original order, so the result equals clean_dataframe(df).
+        Frames under min_rows, or a single worker, fall back to the serial path.
+        """
+        workers = workers or CLEANING_WORKERS
+        if workers <= 1 or len(df) < min_rows:
+            logging.info(f"Cleaning {len(df)} rows serially.")
+            return self.clean_dataframe(df)
+
+        try:
+            df = df.drop_duplicates(subset=["ID"])
+            bounds = np.linspace(0, len(df), workers + 1, dtype=int)
+            shards = [df.iloc[start:end] for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+            logging.info(f"Cleaning {len(df)} rows in {len(shards)} shards on {workers} processes.")
+
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                cleaned_shards = list(pool.map(_clean_shard, shards))  # map keeps shard order
+
+            logging.info("Parallel data cleaning completed successfully.")
+            return pd.concat(cleaned_shards)
+        except Exception as e:
+            logging.error(f"Parallel data cleaning error: {e}")
+            raise
+
+    def iter_chunks(self, path, chunksize=50_000, byte_offset=0, filters=None, byte_end=None, files=None):
+        """Yield a raw CSV file or Parquet dataset as DataFrames of at most chunksize rows.
+
+        byte_offset starts a CSV read at that position (the end of a previous read), taking the
+        column names from the header line, and byte_end stops it there instead of at EOF.
+        filters (pyarrow style) is pushed down into Parquet reads, and files limits them to those
+        part files (relative to the dataset directory).
+        """
+        if is_parquet_path(path):
+            dataset = open_dataset(path, MESSAGE_SCHEMA, files=files)
+            expression = pq.filters_to_expression(filters) if filters else None
+            for batch in dataset.to_batches(columns=MESSAGE_SCHEMA.names, filter=expression, batch_size=chunksize):
+                if batch.num_rows:
+                    yield batch.to_pandas()
+        elif byte_offset or byte_end is not None:
+            columns = pd.read_csv(path, nrows=0).columns if byte_offset else None
+            with open(path, "rb") as f:
+                f.seek(byte_offset)
+                if not f.read(1) or (byte_end is not None and byte_end <= byte_offset):
+                    return
+                f.seek(byte_offset)
+                length = byte_end - byte_offset if byte_end is not None else os.path.getsize(path)
+                reader = io.BufferedReader(_ByteRange(f, length))
+                if byte_offset:
+                    yield from pd.read_csv(reader, header=None, names=columns, chunksize=chunksize, encoding="utf-8")
+                else:
+                    yield from pd.read_csv(reader, chunksize=chunksize, encoding="utf-8")
+        else:
+            yield from pd.read_csv(path, chunksize=chunksize)
+
+    def clean_in_chunks(self, paths, output_path=None, sink=None, chunksize=50_000):
+        """Clean raw files chunk by chunk without ever holding the full dataset in memory.
+
+        Duplicate IDs are dropped across all chunks and files with a SeenIds record. Each cleaned
+        chunk is passed to sink (any callable taking a DataFrame, e.g. a database loader) or
+        appended to the CSV at output_path. Returns (rows_read, rows_written).
+        """
+        if sink is None and output_path is None:
+            raise ValueError("clean_in_chunks needs an output_path or a sink")
+        if isinstance(paths, (str, os.PathLike)):
+            paths = [paths]
+
+        seen_ids = SeenIds()
+        rows_read = rows_written = 0
+        header = True
+        try:
+            for path in paths:
+                logging.info(f"Streaming '{path}' in chunks of {chunksize} rows")
+                for chunk in self.iter_chunks(path, chunksize):
+                    rows_read += len(chunk)
+                    ids = pd.to_numeric(chunk['ID'], errors="coerce").fillna(0).astype(np.int64)
+                    chunk = chunk[seen_ids.take_new(ids.to_numpy())]
+                    if chunk.empty:
+                        continue
+
+                    cleaned = self.clean_dataframe(chunk)
+                    if sink is not None:
+                        sink(cleaned)
+                    else:
+                        cleaned.to_csv(output_path, mode="w" if header else "a", header=header, index=False)
+                        header = False
+                    rows_written += len(cleaned)
+
+            logging.info(f"Streamed {rows_read} rows, wrote {rows_written} cleaned rows ({len(seen_ids)} unique IDs).")
+            return rows_read, rows_written
+        except Exception as e:
+            logging.error(f"Error during chunked cleaning: {e}")
+            raise
+
     def save_cleaned_data(self, df, output_path):
         """Save cleaned data to a new CSV file."""
         try:
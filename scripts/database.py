@@ -1,8 +1,11 @@
 import os
+import io
+import time
+import uuid
 import logging
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
-import pandas as pd
+from sqlalchemy import text
+from db_engine import get_engine
 
 # Ensure logs folder exists
 os.makedirs("../logs", exist_ok=True)
@@ -20,30 +23,26 @@ logging.basicConfig(
 # Load environment variables
 load_dotenv("../.env")
 
-DB_HOST = os.getenv("DB_HOST")
-DB_DATABASE = os.getenv("DB_DATABASE")  # Updated to match .env file
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-DB_PORT = os.getenv("DB_PORT")
+MESSAGE_COLUMNS = [
+    "channel_title", "channel_username", "message_id", "message",
+    "message_date", "media_path", "emoji_used", "youtube_links"
+]
 
+INSERT_MESSAGE_QUERY = """
+INSERT INTO telegram_messages 
+(channel_title, channel_username, message_id, message, message_date, media_path, emoji_used, youtube_links) 
+VALUES (:channel_title, :channel_username, :message_id, :message, :message_date, :media_path, :emoji_used, :youtube_links)
+ON CONFLICT (message_id) DO NOTHING;
+"""
 
-
-def get_db_connection():
-    """ Create and return database engine. """
-    try:
-        DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_DATABASE}"
-        #print(f"DATABASE_URL: {DATABASE_URL}")  # Debugging: Print DATABASE_URL
-        engine = create_engine(DATABASE_URL)
-        with engine.connect() as connection:
-            connection.execute(text("SELECT 1"))  # Test connection
-        logging.info("Successfully connected to the PostgreSQL database.")
-        return engine
-    except Exception as e:
-        logging.error(f"Database connection failed: {e}")
-        raise
+# Rows sent through each COPY + merge round in bulk_insert_data
+BULK_BATCH_SIZE = int(os.getenv("DB_BULK_BATCH_SIZE", 50_000))
 
 
 
+def get_db_connection():
+    """ Return the shared pooled database engine. """
+    return get_engine()
 
 def create_table(engine):
     """ Create telegram_messages table if it does not exist. """
@@ -59,6 +58,8 @@ def create_table(engine):
         emoji_used TEXT,       -- New column for extracted emojis
         youtube_links TEXT     -- New column for extracted YouTube links
     );
+    CREATE INDEX IF NOT EXISTS ix_telegram_messages_channel_username ON telegram_messages (channel_username);
+    CREATE INDEX IF NOT EXISTS ix_telegram_messages_message_date ON telegram_messages (message_date);
     """
     try:
         with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
@@ -68,43 +69,195 @@ def create_table(engine):
         logging.error(f"Error creating table: {e}")
         raise
 
+def create_etl_state_table(engine):
+    """ Create the etl_state table (one watermark row per raw CSV file) and the etl_files table
+    (one row per loaded Parquet part file) if they do not exist.
+    """
+    create_table_query = """
+    CREATE TABLE IF NOT EXISTS etl_state (
+        source TEXT PRIMARY KEY,        -- CSV path
+        file_size BIGINT,               -- Bytes already loaded
+        file_mtime DOUBLE PRECISION,
+        row_offset BIGINT,              -- Rows already loaded
+        max_message_id BIGINT,          -- Highest message_id loaded
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """
+    create_files_query = """
+    CREATE TABLE IF NOT EXISTS etl_files (
+        dataset TEXT NOT NULL,          -- Parquet dataset root
+        file_path TEXT NOT NULL,        -- Part file, relative to the root
+        row_count BIGINT,
+        loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (dataset, file_path)
+    );
+    """
+    try:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.execute(text(create_table_query))
+            connection.execute(text(create_files_query))
+        logging.info("Tables 'etl_state' and 'etl_files' created successfully.")
+    except Exception as e:
+        logging.error(f"Error creating etl_state table: {e}")
+        raise
+
+def get_etl_state(engine, source):
+    """ Return the stored watermark for a source as a dict, or None on its first run. """
+    try:
+        with engine.connect() as connection:
+            row = connection.execute(
+                text("SELECT file_size, file_mtime, row_offset, max_message_id FROM etl_state WHERE source = :source"),
+                {"source": source}
+            ).mappings().first()
+        return dict(row) if row else None
+    except Exception as e:
+        logging.error(f"Error reading ETL state for '{source}': {e}")
+        raise
+
+def save_etl_state(engine, source, file_size, file_mtime, row_offset, max_message_id):
+    """ Insert or update the watermark for a source. """
+    upsert_query = """
+    INSERT INTO etl_state (source, file_size, file_mtime, row_offset, max_message_id, updated_at)
+    VALUES (:source, :file_size, :file_mtime, :row_offset, :max_message_id, CURRENT_TIMESTAMP)
+    ON CONFLICT (source) DO UPDATE SET
+        file_size = EXCLUDED.file_size,
+        file_mtime = EXCLUDED.file_mtime,
+        row_offset = EXCLUDED.row_offset,
+        max_message_id = EXCLUDED.max_message_id,
+        updated_at = EXCLUDED.updated_at;
+    """
+    try:
+        with engine.begin() as connection:
+            connection.execute(text(upsert_query), {
+                "source": source,
+                "file_size": file_size,
+                "file_mtime": file_mtime,
+                "row_offset": row_offset,
+                "max_message_id": max_message_id
+            })
+    except Exception as e:
+        logging.error(f"Error saving ETL state for '{source}': {e}")
+        raise
+
+def get_loaded_files(engine, dataset):
+    """ Return the set of part files (relative paths) of a Parquet dataset that were already loaded. """
+    try:
+        with engine.connect() as connection:
+            rows = connection.execute(
+                text("SELECT file_path FROM etl_files WHERE dataset = :dataset"), {"dataset": dataset}
+            ).scalars()
+            return set(rows)
+    except Exception as e:
+        logging.error(f"Error reading loaded files for '{dataset}': {e}")
+        raise
+
+def mark_file_loaded(engine, dataset, file_path, row_count):
+    """ Record that a Parquet part file was loaded. """
+    insert_query = """
+    INSERT INTO etl_files (dataset, file_path, row_count, loaded_at)
+    VALUES (:dataset, :file_path, :row_count, CURRENT_TIMESTAMP)
+    ON CONFLICT (dataset, file_path) DO NOTHING;
+    """
+    try:
+        with engine.begin() as connection:
+            connection.execute(text(insert_query), {
+                "dataset": dataset, "file_path": file_path, "row_count": row_count
+            })
+    except Exception as e:
+        logging.error(f"Error recording loaded file '{file_path}' of '{dataset}': {e}")
+        raise
+
 def insert_data(engine, cleaned_df):
     """ Inserts cleaned Telegram data into PostgreSQL database. """
+    return bulk_insert_data(engine, cleaned_df)
+
+def bulk_insert_data(engine, cleaned_df, batch_size=BULK_BATCH_SIZE):
+    """ Loads cleaned messages with COPY into an unlogged staging table, then merges each batch
+    into telegram_messages with one INSERT ... SELECT (duplicate message_ids are skipped).
+
+    Each batch is committed on its own. Returns the number of new rows inserted.
+    """
+    staging_table = f"telegram_messages_staging_{uuid.uuid4().hex[:8]}"
+    columns = ", ".join(MESSAGE_COLUMNS)
+    copy_query = f"COPY {staging_table} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+    merge_query = f"""
+    INSERT INTO telegram_messages ({columns})
+    SELECT {columns} FROM {staging_table}
+    ON CONFLICT (message_id) DO NOTHING;
+    """
+    batch_size = max(1, batch_size)
+    inserted = 0
+    start_time = time.perf_counter()
+
+    connection = engine.raw_connection()
     try:
-        # Convert NaT timestamps to None (NULL in SQL)
-        cleaned_df["message_date"] = cleaned_df["message_date"].apply(lambda x: None if pd.isna(x) else str(x))
-
-        insert_query = """
-        INSERT INTO telegram_messages 
-        (channel_title, channel_username, message_id, message, message_date, media_path, emoji_used, youtube_links) 
-        VALUES (:channel_title, :channel_username, :message_id, :message, :message_date, :media_path, :emoji_used, :youtube_links)
-        ON CONFLICT (message_id) DO NOTHING;
-        """
-
-        with engine.begin() as connection:  # Auto-commit enabled
-            for _, row in cleaned_df.iterrows():
-                # Debug log to ensure data is being inserted
-                logging.info(f"Inserting: {row['message_id']} - {row['message_date']}")
-
-                connection.execute(
-                    text(insert_query),
-                    {
-                        "channel_title": row["channel_title"],
-                        "channel_username": row["channel_username"],
-                        "message_id": row["message_id"],
-                        "message": row["message"],
-                        "message_date": row["message_date"],  # No NaT values
-                        "media_path": row["media_path"],
-                        "emoji_used": row["emoji_used"],
-                        "youtube_links": row["youtube_links"]
-                    }
-                )
-
-        logging.info(f"{len(cleaned_df)} records inserted into PostgreSQL database.")
+        cursor = connection.cursor()
+        cursor.execute(f"""
+        CREATE UNLOGGED TABLE {staging_table} (
+            channel_title TEXT,
+            channel_username TEXT,
+            message_id BIGINT,
+            message TEXT,
+            message_date TIMESTAMP,
+            media_path TEXT,
+            emoji_used TEXT,
+            youtube_links TEXT
+        );
+        """)
+        connection.commit()
+
+        for offset in range(0, len(cleaned_df), batch_size):
+            batch = cleaned_df[MESSAGE_COLUMNS].iloc[offset:offset + batch_size]
+            buffer = io.StringIO()
+            batch.to_csv(buffer, index=False, header=False, na_rep="\\N")
+            buffer.seek(0)
+
+            cursor.copy_expert(copy_query, buffer)
+            cursor.execute(merge_query)
+            inserted += max(cursor.rowcount, 0)
+            cursor.execute(f"TRUNCATE {staging_table};")
+            connection.commit()
+            logging.info(f"Loaded rows {offset + 1}-{offset + len(batch)} of {len(cleaned_df)}.")
+
+        elapsed = time.perf_counter() - start_time
+        logging.info(
+            f"{inserted} of {len(cleaned_df)} records inserted into PostgreSQL database "
+            f"in {elapsed:.2f}s ({len(cleaned_df) / max(elapsed, 1e-9):.0f} rows/sec)."
+        )
+        return inserted
     except Exception as e:
-        logging.error(f"Error inserting data: {e}")
+        connection.rollback()
+        logging.error(f"Error bulk inserting data: {e}")
         raise
+    finally:
+        try:
+            cursor = connection.cursor()
+            cursor.execute(f"DROP TABLE IF EXISTS {staging_table};")
+            connection.commit()
+        finally:
+            connection.close()
 
+def insert_records(engine, cleaned_df):
+    """ Inserts a batch of cleaned messages in one executemany round trip.
+
+    Used for the scraper's small streaming micro-batches; bulk_insert_data is faster for large
+    frames but creates and drops a staging table on every call.
+    """
+    try:
+        batch = cleaned_df[MESSAGE_COLUMNS].astype(object)
+        batch["message_date"] = batch["message_date"].astype(str)  # Same text form as insert_data
+        batch = batch.where(cleaned_df[MESSAGE_COLUMNS].notna(), None)  # NaN/NaT -> NULL
+        records = batch.to_dict("records")
+        if not records:
+            return 0
+
+        with engine.begin() as connection:
+            connection.execute(text(INSERT_MESSAGE_QUERY), records)
+
+        logging.info(f"{len(records)} records inserted into PostgreSQL database.")
+        return len(records)
+    except Exception as e:
+        logging.error(f"Error inserting batch: {e}")
         raise
 
 
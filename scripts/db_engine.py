@@ -0,0 +1,119 @@
+import os
+import time
+import logging
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+
+# Load environment variables
+load_dotenv("../.env")
+
+DB_HOST = os.getenv("DB_HOST")
+DB_DATABASE = os.getenv("DB_DATABASE")
+DB_USER = os.getenv("DB_USER")
+DB_PASSWORD = os.getenv("DB_PASSWORD")
+DB_PORT = os.getenv("DB_PORT")
+
+# Connection pool settings shared by every loader
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 5))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))  # Seconds before a connection is replaced
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_database_url():
+    """ PostgreSQL URL built from the DB_* environment variables. """
+    return f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_DATABASE}"
+
+
+def get_engine(url=None, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+               pool_pre_ping=DB_POOL_PRE_PING, pool_recycle=DB_POOL_RECYCLE, pool_timeout=DB_POOL_TIMEOUT):
+    """ Return the pooled engine for these settings, creating it on first use.
+
+    Every caller in the process shares the same engine (and so the same connection pool),
+    and the SELECT 1 connection check only runs when the engine is created.
+    """
+    url = url or get_database_url()
+    key = (url, pool_size, max_overflow, pool_pre_ping, pool_recycle, pool_timeout)
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is not None:
+            return engine
+        try:
+            engine = create_engine(
+                url,
+                pool_size=pool_size,
+                max_overflow=max_overflow,
+                pool_pre_ping=pool_pre_ping,
+                pool_recycle=pool_recycle,
+                pool_timeout=pool_timeout
+            )
+            with engine.connect() as connection:
+                connection.execute(text("SELECT 1"))  # Test connection
+            logging.info(
+                f"Successfully connected to the PostgreSQL database "
+                f"(pool_size={pool_size}, max_overflow={max_overflow})."
+            )
+            _engines[key] = engine
+            return engine
+        except Exception as e:
+            logging.error(f"Database connection failed: {e}")
+            raise
+
+
+def partition_frame(df, partition_by="id", partitions=4, channel_column="channel_username", id_column="message_id"):
+    """ Split a cleaned frame for parallel loading.
+
+    partition_by="id" sorts by id_column and cuts it into `partitions` contiguous ID ranges; cuts
+    are moved to where the key changes, so a repeated key never lands in two partitions.
+    partition_by="channel" gives one partition per channel.
+    """
+    if partition_by == "channel":
+        return [group for _, group in df.groupby(channel_column, sort=False, dropna=False)]
+    if partition_by == "id":
+        df = df.sort_values(id_column, kind="stable")
+        keys = df[id_column].to_numpy()
+        bounds = np.linspace(0, len(df), max(1, partitions) + 1, dtype=int)
+        # Move every inner cut back to the first row of its key
+        inner = np.searchsorted(keys, keys[bounds[1:-1]], side="left") if len(df) else bounds[1:-1]
+        bounds = np.unique(np.concatenate([[0], inner, [len(df)]]))
+        return [df.iloc[start:end] for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+    raise ValueError(f"Unknown partition_by '{partition_by}', expected 'channel' or 'id'")
+
+
+def parallel_load(engine, df, loader, partition_by="id", workers=None,
+                  channel_column="channel_username", id_column="message_id", **loader_kwargs):
+    """ Load df with loader(engine, partition, **loader_kwargs) on several pooled connections at once.
+
+    workers defaults to the engine's pool size. id_column must be the loader's conflict key:
+    ID-range partitions keep every key in a single partition, so concurrent ON CONFLICT inserts
+    never wait on (or deadlock over) each other's rows. Channel partitions do not give that
+    guarantee for telegram_messages, whose message IDs are numbered per channel but conflict on
+    message_id alone. Returns the summed loader results.
+    """
+    workers = max(1, workers or engine.pool.size())
+    partitions = partition_frame(df, partition_by, workers, channel_column, id_column)
+    if not partitions:
+        return 0
+
+    start_time = time.perf_counter()
+    logging.info(f"Loading {len(df)} rows in {len(partitions)} partitions on {workers} connections.")
+    try:
+        with ThreadPoolExecutor(max_workers=min(workers, len(partitions))) as executor:
+            futures = [executor.submit(loader, engine, partition, **loader_kwargs) for partition in partitions]
+            results = [future.result() for future in futures]
+
+        loaded = sum(result or 0 for result in results)
+        elapsed = time.perf_counter() - start_time
+        logging.info(f"Parallel load finished in {elapsed:.2f}s ({len(df) / max(elapsed, 1e-9):.0f} rows/sec).")
+        return loaded
+    except Exception as e:
+        logging.error(f"Parallel load failed: {e}")
+        raise
+
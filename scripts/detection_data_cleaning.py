@@ -1,6 +1,8 @@
 import pandas as pd
+import numpy as np
 import os
 import logging
+from parquet_store import DETECTION_SCHEMA, read_dataset, is_parquet_path
 
 # Setup logging to file and console
 LOG_FILE = "detection_data_cleaning.log"
@@ -19,6 +21,8 @@ class DetectionDataCleaning:
     
     def load_data(self, path):
         logging.info("Loading the data")
+        if is_parquet_path(path):
+            return self.load_parquet(path)
         try:
             df = pd.read_csv(path)
             self.dataframes.append(df)
@@ -27,6 +31,17 @@ class DetectionDataCleaning:
             logging.error(f"Error occurred while loading the data: {e}")
             return None
 
+    def load_parquet(self, path, columns=None, filters=None):
+        """Load detections from the partitioned Parquet dataset with column projection and filters."""
+        logging.info(f"Loading Parquet data from '{path}'")
+        try:
+            df = read_dataset(path, DETECTION_SCHEMA, columns=columns or DETECTION_SCHEMA.names, filters=filters)
+            self.dataframes.append(df)
+            return df
+        except Exception as e:
+            logging.error(f"Error occurred while loading the Parquet data: {e}")
+            return None
+
     
     
     def check_duplicates(self, df):
@@ -70,3 +85,73 @@ class DetectionDataCleaning:
     
     
 
+
+    def clean_detections(self, df, conf_threshold=0.25, iou_threshold=0.45):
+        """Filter low-confidence boxes, run per-image, per-class NMS and cast to compact dtypes.
+
+        NMS is exact greedy suppression done for every (file_name, class_id) group at once: all
+        overlapping pairs inside a group are built with NumPy, then a box is dropped if a kept,
+        higher-confidence box of its group overlaps it by more than iou_threshold, iterated
+        until nothing changes. Rows come out sorted by file, class and descending confidence,
+        so the first box the UNIQUE (file_name, class_id) constraint keeps is the best one.
+        Boxes without a confidence (5-column labels) are kept when conf_threshold is None.
+        """
+        try:
+            rows_in = len(df)
+            df = df.dropna(subset=['file_name', 'class_id', 'x_center', 'y_center', 'width', 'height'])
+            if conf_threshold is not None:
+                df = df[df['confidence'] >= conf_threshold]
+
+            df = df.sort_values(['file_name', 'class_id', 'confidence'], ascending=[True, True, False],
+                                kind='stable', na_position='last').reset_index(drop=True)
+            keep = self._nms_keep(df, iou_threshold)
+            df = df[keep].reset_index(drop=True)
+
+            df = df.astype({
+                'file_name': 'category',
+                'class_id': 'int32',
+                'x_center': 'float32',
+                'y_center': 'float32',
+                'width': 'float32',
+                'height': 'float32',
+                'confidence': 'float32'
+            })
+            logging.info(f"Detection cleaning kept {len(df)} of {rows_in} rows "
+                         f"(confidence >= {conf_threshold}, NMS IoU {iou_threshold})")
+            return df
+        except Exception as e:
+            logging.error(f"Error cleaning detections: {e}")
+            raise e
+
+    @staticmethod
+    def _nms_keep(df, iou_threshold):
+        """Boolean mask of the boxes greedy NMS keeps; df must be sorted by group and confidence."""
+        n = len(df)
+        if n == 0:
+            return np.zeros(0, dtype=bool)
+        groups = df.groupby(['file_name', 'class_id'], sort=False).ngroup().to_numpy()
+        group_end = np.searchsorted(groups, groups, side='right')  # Groups are contiguous
+
+        # Every pair (i, j) with i before j in the same group, i.e. i has the higher confidence
+        partners = group_end - np.arange(n) - 1
+        first = np.repeat(np.arange(n), partners)
+        offsets = np.arange(len(first)) - np.repeat(np.cumsum(partners) - partners, partners)
+        second = first + 1 + offsets
+
+        x, y = df['x_center'].to_numpy(np.float64), df['y_center'].to_numpy(np.float64)
+        w, h = df['width'].to_numpy(np.float64), df['height'].to_numpy(np.float64)
+        x1, y1, x2, y2 = x - w / 2, y - h / 2, x + w / 2, y + h / 2
+        inter_w = np.clip(np.minimum(x2[first], x2[second]) - np.maximum(x1[first], x1[second]), 0, None)
+        inter_h = np.clip(np.minimum(y2[first], y2[second]) - np.maximum(y1[first], y1[second]), 0, None)
+        inter = inter_w * inter_h
+        union = w[first] * h[first] + w[second] * h[second] - inter
+        overlapping = inter > iou_threshold * np.maximum(union, 1e-12)
+        first, second = first[overlapping], second[overlapping]
+
+        # A box survives unless a surviving box before it overlaps it; the fixed point is greedy NMS
+        keep = np.ones(n, dtype=bool)
+        while True:
+            suppressed = np.bincount(second, weights=keep[first], minlength=n) > 0
+            if np.array_equal(~suppressed, keep):
+                return keep
+            keep = ~suppressed
@@ -0,0 +1,91 @@
+import os
+import json
+import hashlib
+import logging
+
+DONE_STATUSES = ("detections", "no_detections")
+
+
+class DetectionManifest:
+    """ Outcome of every image that went through detection, persisted to a JSON file.
+
+    Images are keyed by their path relative to the image directory and remember size, mtime and
+    SHA-256 of the content they were processed with, plus a status: "detections",
+    "no_detections" or "error". An image is done while its size and mtime are unchanged; if
+    they changed, the content hash decides, so a touched-but-identical file is not redone.
+    Images that errored are tried again on the next run.
+    """
+
+    def __init__(self, path, image_dir):
+        self.path = path
+        self.image_dir = image_dir
+        self.images = self._load()
+
+    def _load(self):
+        try:
+            if not os.path.exists(self.path):
+                logging.info(f"No detection manifest at {self.path}, processing every image")
+                return {}
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f).get("images", {})
+        except Exception as e:
+            logging.error(f"Error reading detection manifest from {self.path}: {e}")
+            return {}
+
+    def _key(self, path):
+        return os.path.relpath(path, self.image_dir)
+
+    @staticmethod
+    def hash_bytes(data):
+        return hashlib.sha256(data).hexdigest()
+
+    def is_done(self, path):
+        """ True if path was processed successfully and has not changed since. """
+        entry = self.images.get(self._key(path))
+        if not entry or entry["status"] not in DONE_STATUSES:
+            return False
+        stat = os.stat(path)
+        if entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            return True
+        if entry["size"] != stat.st_size:
+            return False
+        with open(path, "rb") as f:
+            unchanged = self.hash_bytes(f.read()) == entry["sha256"]
+        if unchanged:
+            entry["mtime"] = stat.st_mtime
+        return unchanged
+
+    def pending(self, paths):
+        """ The paths that still need detection: new, changed or previously failed images. """
+        return [path for path in paths if not self.is_done(path)]
+
+    def record(self, path, status, digest=None, detections=0, error=None):
+        """ Store the outcome of one image; digest is the SHA-256 of the bytes that were processed. """
+        stat = os.stat(path)
+        self.images[self._key(path)] = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "sha256": digest,
+            "status": status,
+            "detections": detections,
+            "error": error
+        }
+
+    def counts(self):
+        """ Number of images per status. """
+        counts = {}
+        for entry in self.images.values():
+            counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+        return counts
+
+    def save(self):
+        """ Write the manifest atomically so a crash never leaves a half-written file. """
+        try:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"images": self.images}, f)
+            os.replace(tmp_path, self.path)
+            logging.info(f"Detection manifest saved to {self.path} ({self.counts()})")
+        except Exception as e:
+            logging.error(f"Error saving detection manifest to {self.path}: {e}")
+            raise
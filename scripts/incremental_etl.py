@@ -0,0 +1,172 @@
+import os
+import glob
+import time
+import logging
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import database
+from DataCleaningTransformation import DataCleaning
+from parquet_store import is_parquet_path, list_parts
+
+RAW_CSV_GLOB = os.getenv("ETL_RAW_CSV_GLOB", "../data/*_data.csv")
+RAW_PARQUET_DIR = os.getenv("ETL_RAW_PARQUET_DIR", "../data/raw/messages")
+ETL_CHUNKSIZE = int(os.getenv("ETL_CHUNKSIZE", 50_000))
+
+
+def last_row_end(path, start, end, block_size=1 << 24):
+    """ Offset just past the last complete CSV row between start and end.
+
+    A row ends at a newline outside quotes. CSV escapes a quote by doubling it, so a newline is
+    outside quotes when an even number of quote characters precedes it. A row the scraper is
+    still writing is left for the next run.
+    """
+    boundary, position, quotes = start, start, 0
+    with open(path, "rb") as f:
+        f.seek(start)
+        while position < end:
+            block = np.frombuffer(f.read(min(block_size, end - position)), dtype=np.uint8)
+            if not len(block):
+                break
+            parity = (quotes + np.cumsum(block == ord('"'))) % 2
+            newlines = np.flatnonzero((block == ord("\n")) & (parity == 0))
+            if len(newlines):
+                boundary = position + int(newlines[-1]) + 1
+            quotes = int(parity[-1])
+            position += len(block)
+    return boundary
+
+
+def ends_row(path, offset):
+    """ True if offset is just past a newline, i.e. a saved offset still falls on a row boundary. """
+    with open(path, "rb") as f:
+        f.seek(offset - 1)
+        return f.read(1) == b"\n"
+
+
+class IncrementalETL:
+    """ Cleans and loads only the raw messages added since the last run.
+
+    - a scraper CSV (appended to between runs) keeps a watermark row in etl_state with the
+      byte offset just past the last complete row it loaded, and the next run reads from there;
+      a half-written last row is left for the next run. A file that shrank, or whose saved
+      offset no longer ends a row (it was rewritten), is loaded again from the start
+    - a Parquet dataset is append-only with a unique name per part file, so etl_files records
+      each part file once it is loaded and the next run reads only the others. Message IDs are
+      not used here: a backfill writes parts with lower IDs after newer ones
+    Progress is only saved after its rows are committed, so a failed run repeats at most the
+    unfinished file, and ON CONFLICT (message_id) DO NOTHING absorbs the overlap.
+    """
+
+    def __init__(self, engine, chunksize=ETL_CHUNKSIZE, loader=database.bulk_insert_data):
+        self.engine = engine
+        self.chunksize = chunksize
+        self.loader = loader
+        self.data_cleaning = DataCleaning()
+        database.create_etl_state_table(engine)
+
+    def run(self, paths):
+        """ Process every CSV file and Parquet dataset in paths; returns (rows_read, rows_loaded). """
+        start_time = time.perf_counter()
+        rows_read = rows_loaded = 0
+        for path in paths:
+            if is_parquet_path(path):
+                read, loaded = self.process_parquet(path)
+            else:
+                read, loaded = self.process_csv(path)
+            rows_read += read
+            rows_loaded += loaded
+        logging.info(
+            f"Incremental ETL read {rows_read} new rows and loaded {rows_loaded} "
+            f"in {time.perf_counter() - start_time:.2f}s."
+        )
+        return rows_read, rows_loaded
+
+    def process_csv(self, path):
+        """ Load the rows appended to a scraper CSV since its last run. """
+        source = os.path.abspath(path)
+        stat = os.stat(path)
+        state = database.get_etl_state(self.engine, source)
+
+        if state and state["file_size"] == stat.st_size and state["file_mtime"] == stat.st_mtime:
+            logging.info(f"'{path}' is unchanged, skipping.")
+            return 0, 0
+        if state and 0 < state["file_size"] <= stat.st_size and ends_row(path, state["file_size"]):
+            byte_offset, row_offset, max_id = state["file_size"], state["row_offset"], state["max_message_id"]
+        else:
+            if state:
+                logging.info(f"'{path}' shrank or was rewritten since the last run, loading it again from the start.")
+            byte_offset, row_offset, max_id = 0, 0, None
+
+        # Stop at the last complete row; the scraper may still be appending to the file
+        byte_end = last_row_end(path, byte_offset, stat.st_size)
+        if byte_end == byte_offset:
+            logging.info(f"No complete new rows in '{path}' after byte {byte_offset}.")
+            return 0, 0
+
+        logging.info(f"Loading '{path}' from byte {byte_offset} to {byte_end} (row {row_offset}).")
+        rows_read, rows_loaded, max_id = self._load_chunks(
+            self.data_cleaning.iter_chunks(path, self.chunksize, byte_offset=byte_offset, byte_end=byte_end), max_id
+        )
+        database.save_etl_state(self.engine, source, byte_end, stat.st_mtime, row_offset + rows_read, max_id)
+        return rows_read, rows_loaded
+
+    def process_parquet(self, root):
+        """ Load the part files of a Parquet dataset that no earlier run loaded. """
+        if os.path.isdir(root):
+            parts = list_parts(root)
+        else:
+            root, parts = os.path.split(root)
+            parts = [parts]
+        dataset = os.path.abspath(root)
+        loaded_files = database.get_loaded_files(self.engine, dataset)
+
+        new_parts = [part for part in parts if part not in loaded_files]
+        rows_read = rows_loaded = 0
+        for part in new_parts:
+            try:
+                pq.read_metadata(os.path.join(root, part))
+            except Exception:
+                # No footer yet: the writer has not finished this file
+                logging.info(f"'{part}' of '{root}' is not complete yet, leaving it for the next run.")
+                continue
+
+            read, loaded, _ = self._load_chunks(
+                self.data_cleaning.iter_chunks(root, self.chunksize, files=[part]), None
+            )
+            database.mark_file_loaded(self.engine, dataset, part, read)
+            rows_read += read
+            rows_loaded += loaded
+        logging.info(f"'{root}': {rows_read} rows from {len(new_parts)} new part files.")
+        return rows_read, rows_loaded
+
+    def _load_chunks(self, chunks, max_id):
+        """ Clean and load each chunk; returns (rows_read, rows_loaded, new max message_id). """
+        rows_read = rows_loaded = 0
+        for chunk in chunks:
+            rows_read += len(chunk)
+            chunk_max = pd.to_numeric(chunk["ID"], errors="coerce").max()
+            if pd.notna(chunk_max):
+                max_id = int(chunk_max) if max_id is None else max(max_id, int(chunk_max))
+
+            cleaned = self.data_cleaning.clean_dataframe(chunk)
+            if not cleaned.empty:
+                rows_loaded += self.loader(self.engine, cleaned) or 0
+        return rows_read, rows_loaded, max_id
+
+
+def main():
+    try:
+        engine = database.get_db_connection()
+        database.create_table(engine)
+        paths = sorted(glob.glob(RAW_CSV_GLOB))
+        if os.path.isdir(RAW_PARQUET_DIR):
+            paths.append(RAW_PARQUET_DIR)
+        IncrementalETL(engine).run(paths)
+    except Exception as e:
+        logging.error(f"Incremental ETL failed: {e}")
+        raise
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
 import os
+import time
 import logging
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+from db_engine import get_engine
 import pandas as pd
 
 # Ensure logs folder exists
@@ -20,25 +22,15 @@ logging.basicConfig(
 # Load environment variables
 load_dotenv("../.env")
 
-DB_HOST = os.getenv("DB_HOST")
-DB_DATABASE = os.getenv("DB_DATABASE")
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-DB_PORT = os.getenv("DB_PORT")
+DETECTION_COLUMNS = ["file_name", "class_id", "x_center", "y_center", "width", "height", "confidence"]
+
+# Rows per multi-row INSERT; PostgreSQL allows at most 65535 bind parameters per statement
+DETECTION_BATCH_SIZE = int(os.getenv("DB_DETECTION_BATCH_SIZE", 1000))
+MAX_BATCH_SIZE = 65535 // len(DETECTION_COLUMNS)
 
 def get_db_connection():
-    """ Create and return database engine. """
-    try:
-        DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_DATABASE}"
-        
-        engine = create_engine(DATABASE_URL)
-        with engine.connect() as connection:
-            connection.execute(text("SELECT 1"))  # Test connection
-        logging.info("Successfully connected to the PostgreSQL database.")
-        return engine
-    except Exception as e:
-        logging.error(f"Database connection failed: {e}")
-        raise
+    """ Return the shared pooled database engine. """
+    return get_engine()
 
 def create_table(engine):
     """ Create detection_results table if it does not exist. """
@@ -65,35 +57,57 @@ def create_table(engine):
 
 
 
-def insert_data(engine, cleaned_df):
+def insert_data(engine, cleaned_df, replace=False):
     """ Inserts cleaned detection data into PostgreSQL database. """
+    return bulk_insert_data(engine, cleaned_df, replace=replace)
+
+def _batch_insert_query(rows, replace):
+    """ Multi-row INSERT for `rows` rows with numbered bind parameters. """
+    values = ", ".join(
+        "(" + ", ".join(f":{column}_{i}" for column in DETECTION_COLUMNS) + ")" for i in range(rows)
+    )
+    if replace:
+        updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in DETECTION_COLUMNS[2:])
+        conflict = f"DO UPDATE SET {updates}"
+    else:
+        conflict = "DO NOTHING"
+    return text(f"""
+    INSERT INTO detection_results ({", ".join(DETECTION_COLUMNS)})
+    VALUES {values}
+    ON CONFLICT (file_name, class_id) {conflict};
+    """)
+
+def bulk_insert_data(engine, cleaned_df, batch_size=DETECTION_BATCH_SIZE, replace=False):
+    """ Inserts detections with one multi-row INSERT per batch of batch_size rows.
+
+    By default rows whose (file_name, class_id) already exists are skipped. With replace=True
+    they are overwritten with the new box and confidence instead. Returns the number of rows sent.
+    """
     try:
-        insert_query = """
-        INSERT INTO detection_results 
-        (file_name, class_id, x_center, y_center, width, height, confidence) 
-        VALUES (:file_name, :class_id, :x_center, :y_center, :width, :height, :confidence)
-        ON CONFLICT (file_name, class_id) DO NOTHING;  -- Use the columns with unique constraint
-        """
-
-        with engine.begin() as connection:  # Auto-commit enabled
-            for _, row in cleaned_df.iterrows():
-                # Debug log to ensure data is being inserted
-                logging.info(f"Inserting: {row['file_name']} - {row['class_id']}")
-
-                connection.execute(
-                    text(insert_query),
-                    {
-                        "file_name": row["file_name"],
-                        "class_id": row["class_id"],
-                        "x_center": row["x_center"],
-                        "y_center": row["y_center"],
-                        "width": row["width"],
-                        "height": row["height"],
-                        "confidence": row["confidence"]
-                    }
-                )
-
-        logging.info(f"{len(cleaned_df)} records inserted into PostgreSQL database.")
+        start_time = time.perf_counter()
+        batch_size = min(max(1, batch_size), MAX_BATCH_SIZE)
+
+        # One statement can't touch the same key twice, so keep the row that would have won:
+        # the first one when existing rows are kept, the last one when they are replaced.
+        df = cleaned_df.drop_duplicates(subset=["file_name", "class_id"], keep="last" if replace else "first")
+        df = df[DETECTION_COLUMNS]
+        records = df.astype(object).where(df.notna(), None).to_dict("records")
+
+        queries = {}
+        with engine.begin() as connection:
+            for offset in range(0, len(records), batch_size):
+                batch = records[offset:offset + batch_size]
+                if len(batch) not in queries:
+                    queries[len(batch)] = _batch_insert_query(len(batch), replace)
+                params = {f"{column}_{i}": row[column] for i, row in enumerate(batch) for column in DETECTION_COLUMNS}
+                connection.execute(queries[len(batch)], params)
+
+        elapsed = time.perf_counter() - start_time
+        logging.info(
+            f"{len(records)} records {'upserted' if replace else 'inserted'} into PostgreSQL database "
+            f"in {elapsed:.2f}s ({len(records) / max(elapsed, 1e-9):.0f} rows/sec)."
+        )
+        return len(records)
     except Exception as e:
         logging.error(f"Error inserting data: {e}")
         raise
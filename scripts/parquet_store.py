@@ -0,0 +1,141 @@
+import os
+import uuid
+import logging
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Raw scraped messages keep the CSV column names so DataCleaning works on either format
+MESSAGE_SCHEMA = pa.schema([
+    ("Channel Title", pa.string()),
+    ("Channel Username", pa.string()),
+    ("ID", pa.int64()),
+    ("Message", pa.string()),
+    ("Date", pa.timestamp("us", tz="UTC")),
+    ("Media Path", pa.string()),
+])
+
+DETECTION_SCHEMA = pa.schema([
+    ("file_name", pa.string()),
+    ("class_id", pa.int32()),
+    ("x_center", pa.float32()),
+    ("y_center", pa.float32()),
+    ("width", pa.float32()),
+    ("height", pa.float32()),
+    ("confidence", pa.float32()),
+])
+
+# Both datasets are laid out as <root>/channel=<name>/date=<YYYY-MM-DD>/part-*.parquet
+PARTITION_SCHEMA = pa.schema([("channel", pa.string()), ("date", pa.string())])
+PARTITIONING = ds.partitioning(PARTITION_SCHEMA, flavor="hive")
+
+
+def _with_partitions(schema):
+    for field in PARTITION_SCHEMA:
+        schema = schema.append(field)
+    return schema
+
+
+def _write_partitioned(df, root, schema):
+    table = pa.Table.from_pandas(df, schema=_with_partitions(schema), preserve_index=False)
+    ds.write_dataset(
+        table,
+        root,
+        format="parquet",
+        partitioning=PARTITIONING,
+        basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore"
+    )
+
+
+def write_messages(df, root):
+    """ Append raw scraped messages (CSV column names) to the partitioned message dataset. """
+    try:
+        df = df.copy()
+        df["Date"] = pd.to_datetime(df["Date"], errors="coerce", utc=True)
+        df["channel"] = df["Channel Username"].str.lstrip("@")
+        df["date"] = df["Date"].dt.strftime("%Y-%m-%d").fillna("unknown")
+        _write_partitioned(df, root, MESSAGE_SCHEMA)
+        logging.info(f"Wrote {len(df)} messages to Parquet dataset '{root}'.")
+    except Exception as e:
+        logging.error(f"Error writing messages to Parquet: {e}")
+        raise
+
+
+def media_channels(messages):
+    """ Map media file names to the channel that posted them.
+
+    messages has the raw 'Channel Username' and 'Media Path' columns (CSV or the message dataset).
+    Media store blobs are named after their content hash, so this is the only place that still
+    knows which channel an image came from.
+    """
+    messages = messages[["Channel Username", "Media Path"]].dropna()
+    names = messages["Media Path"].astype(str).map(os.path.basename)
+    return dict(zip(names, messages["Channel Username"].astype(str).str.lstrip("@")))
+
+
+def write_detections(df, root, run_date=None, channels=None):
+    """ Append detections to the partitioned detection dataset.
+
+    The channel is looked up by file name in channels (see media_channels), falling back to
+    legacy '@channel_<id>.<ext>' file names; the date is the detection run date.
+    """
+    try:
+        df = df.copy()
+        channel = df["file_name"].map(channels) if channels else pd.Series(None, index=df.index, dtype=object)
+        legacy = df["file_name"].str.extract(r"^@?([A-Za-z0-9_]+?)_\d+\.", expand=False)
+        df["channel"] = channel.fillna(legacy).fillna("unknown")
+        df["date"] = run_date or pd.Timestamp.now(tz="UTC").strftime("%Y-%m-%d")
+        _write_partitioned(df, root, DETECTION_SCHEMA)
+        logging.info(f"Wrote {len(df)} detections to Parquet dataset '{root}'.")
+    except Exception as e:
+        logging.error(f"Error writing detections to Parquet: {e}")
+        raise
+
+
+def open_dataset(root, schema, files=None):
+    """ Open a partitioned dataset written by write_messages or write_detections.
+
+    files limits it to those part files (paths relative to root); their channel and date still
+    come from the directories under root.
+    """
+    if files is not None:
+        return ds.dataset(
+            [os.path.join(root, name) for name in files], format="parquet", schema=_with_partitions(schema),
+            partitioning=PARTITIONING, partition_base_dir=root
+        )
+    return ds.dataset(root, format="parquet", schema=_with_partitions(schema), partitioning=PARTITIONING)
+
+
+def list_parts(root):
+    """ Part files of a dataset directory as sorted paths relative to root. """
+    parts = []
+    for directory, _, names in os.walk(root):
+        parts.extend(
+            os.path.relpath(os.path.join(directory, name), root) for name in names if name.endswith(".parquet")
+        )
+    return sorted(parts)
+
+
+def read_dataset(root, schema, columns=None, filters=None):
+    """ Read a partitioned dataset into a DataFrame.
+
+    columns limits the columns read from disk and filters (pandas/pyarrow style, e.g.
+    [("channel", "=", "CheMed123"), ("date", ">=", "2024-01-01")]) skips partitions and
+    row groups that cannot match.
+    """
+    try:
+        dataset = open_dataset(root, schema)
+        expression = pq.filters_to_expression(filters) if filters else None
+        table = dataset.to_table(columns=columns, filter=expression)
+        logging.info(f"Read {table.num_rows} rows from Parquet dataset '{root}'.")
+        return table.to_pandas()
+    except Exception as e:
+        logging.error(f"Error reading Parquet dataset '{root}': {e}")
+        raise
+
+
+def is_parquet_path(path):
+    """ True for a .parquet file or a directory holding a Parquet dataset. """
+    return str(path).endswith(".parquet") or os.path.isdir(path)
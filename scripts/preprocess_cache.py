@@ -0,0 +1,123 @@
+import os
+import re
+import uuid
+import hashlib
+import logging
+import threading
+import numpy as np
+
+# MediaStore blobs are already named after the SHA-256 of their content
+BLOB_NAME = re.compile(r'^[0-9a-f]{64}$')
+
+
+class PreprocessCache:
+    """ Disk cache of decoded, resized detection inputs.
+
+    Each image is stored once per input size as <root>/<imgsz>/<aa>/<sha256>.npy (RGB uint8, long
+    side <= imgsz) and read back with np.load(mmap_mode='r'), so a cached image costs no decode,
+    resize or copy. Entries are keyed by content hash, so renamed or re-downloaded photos still
+    hit. Every hit refreshes the file's mtime, and once the cache grows past max_bytes the least
+    recently used entries are removed until it is back under low_water * max_bytes.
+    """
+
+    def __init__(self, root, max_bytes=10 * 1024 ** 3, low_water=0.9):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self.size = sum(os.path.getsize(path) for path, _ in self._entries())
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def _entries(self):
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith('.npy'):
+                    path = os.path.join(directory, name)
+                    try:
+                        yield path, os.stat(path).st_mtime
+                    except FileNotFoundError:
+                        continue  # Evicted by another process
+
+    def _path(self, digest, imgsz):
+        return os.path.join(self.root, str(imgsz), digest[:2], f'{digest}.npy')
+
+    def load(self, path, imgsz, decode):
+        """ Return (image, sha256) for an image file, calling decode(data) only on a cache miss.
+
+        decode turns the file's bytes into the array to cache (or None if they are not an image).
+        """
+        stem = os.path.splitext(os.path.basename(path))[0]
+        data = None
+        if BLOB_NAME.match(stem):
+            digest = stem
+        else:
+            with open(path, 'rb') as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()
+
+        cached = self.get(digest, imgsz)
+        if cached is not None:
+            return cached, digest
+
+        if data is None:
+            with open(path, 'rb') as f:
+                data = f.read()
+        image = decode(data)
+        if image is not None:
+            self.put(digest, imgsz, image)
+        return image, digest
+
+    def get(self, digest, imgsz):
+        """ Memory-mapped cached array, or None. """
+        path = self._path(digest, imgsz)
+        try:
+            image = np.load(path, mmap_mode='r')
+            os.utime(path)  # Mark as recently used
+        except (FileNotFoundError, ValueError, OSError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return image
+
+    def put(self, digest, imgsz, image):
+        """ Store an array atomically and evict old entries if the cache is over its budget. """
+        path = self._path(digest, imgsz)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.save(f, np.ascontiguousarray(image))
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logging.error(f'Error caching preprocessed image {digest}: {e}')
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        with self._lock:
+            self.size += os.path.getsize(path)
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """ Remove least recently used entries down to the low-water mark; caller holds the lock. """
+        target = self.max_bytes * self.low_water
+        for path, _ in sorted(self._entries(), key=lambda entry: entry[1]):
+            if self.size <= target:
+                break
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            self.size -= size
+            self.evicted += 1
+        logging.info(f'Preprocess cache evicted down to {self.size / 1024 ** 2:.0f} MB ({self.evicted} entries so far)')
+
+    def stats(self):
+        """ Snapshot of the cache counters. """
+        return {'hits': self.hits, 'misses': self.misses, 'evicted': self.evicted, 'bytes': self.size}
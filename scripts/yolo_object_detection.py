@@ -1,13 +1,39 @@
+import os
+import glob
+import time
+import multiprocessing
+from functools import partial
 import torch
 import cv2
+import numpy as np
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 import logging
 import pandas as pd
+from parquet_store import MESSAGE_SCHEMA, media_channels, read_dataset, write_detections
+from detection_manifest import DetectionManifest
+from preprocess_cache import PreprocessCache
 
 # Set up logging
 logging.basicConfig(filename='detection.log', level=logging.INFO,
                     format='%(asctime)s %(levelname)s %(message)s')
 
+# Detection settings
+IMAGE_DIR = os.getenv("DETECTION_IMAGE_DIR", "../photos")
+BATCH_SIZE = int(os.getenv("DETECTION_BATCH_SIZE", 16))
+IMAGE_SIZE = int(os.getenv("DETECTION_IMAGE_SIZE", 640))
+DECODE_WORKERS = int(os.getenv("DETECTION_DECODE_WORKERS", 4))
+TORCH_THREADS = int(os.getenv("DETECTION_TORCH_THREADS", 0)) or None  # None = one per core
+PROCESSES = int(os.getenv("DETECTION_PROCESSES", 0)) or None  # None = one per core
+SHARD_SIZE = int(os.getenv("DETECTION_SHARD_SIZE", 64))  # Images handed to a worker process at a time
+CONF_THRESHOLD = float(os.getenv("DETECTION_CONF_THRESHOLD", 0.25))
+MANIFEST_PATH = os.getenv("DETECTION_MANIFEST", "../data/detection_manifest.json")
+CACHE_DIR = os.getenv("DETECTION_CACHE_DIR")  # Preprocessed image cache, off when unset
+CACHE_MAX_BYTES = int(os.getenv("DETECTION_CACHE_MAX_BYTES", 10 * 1024 ** 3))
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp'}
+DETECTION_COLUMNS = ['file_name', 'class_id', 'x_center', 'y_center', 'width', 'height', 'confidence']
+
 def setup_logging():
     logging.info('🚀 Starting object detection process.')
 
@@ -23,37 +49,411 @@ def load_yolo_model():
     log_info('YOLO model loaded successfully.')
     return model
 
-def process_the_YOLO_object(path):
-    logger.info("Processing the data collected from the YOLO object detection model...")
-    output_data = []
+def find_images(image_dir):
+    """ Every image under image_dir (including the media store's blobs/), skipping its tmp/ download area. """
+    images = []
+    for root, dirs, files in os.walk(image_dir):
+        dirs[:] = sorted(d for d in dirs if d != 'tmp')
+        images.extend(os.path.join(root, f) for f in sorted(files) if Path(f).suffix.lower() in IMAGE_EXTENSIONS)
+    return images
+
+def decode_image(data, imgsz=IMAGE_SIZE):
+    """ Decode encoded image bytes to RGB and shrink them so the long side is at most imgsz,
+    keeping the aspect ratio. Returns None if the bytes are not an image.
+    """
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    height, width = image.shape[:2]
+    scale = imgsz / max(height, width)
+    if scale < 1:
+        image = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+def load_image(path, imgsz=IMAGE_SIZE, with_digest=False):
+    """ Read and decode one image; cv2 and hashlib release the GIL, so this runs well in a thread pool.
+
+    Returns the RGB image (None if unreadable), or (image, sha256 of the file) with with_digest.
+    """
+    image = digest = None
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        image = decode_image(data, imgsz)
+        if image is None:
+            log_error(f'Could not decode {path}')
+        if with_digest:
+            digest = DetectionManifest.hash_bytes(data)
+    except Exception as e:
+        log_error(f'Could not load {path}: {e}')
+    return (image, digest) if with_digest else image
+
+def _results_to_frame(paths, boxes_per_image):
+    """ Turn per-image [x, y, w, h, conf, cls] arrays (normalized xywh) into detection_results rows. """
+    boxes = [b.cpu().numpy() if hasattr(b, 'cpu') else np.asarray(b) for b in boxes_per_image]
+    counts = [len(b) for b in boxes]
+    boxes = np.concatenate(boxes) if sum(counts) else np.empty((0, 6), dtype=np.float32)
+    return pd.DataFrame({
+        'file_name': np.repeat([os.path.basename(p) for p in paths], counts),
+        'class_id': boxes[:, 5].astype(np.int32),
+        'x_center': boxes[:, 0].astype(np.float32),
+        'y_center': boxes[:, 1].astype(np.float32),
+        'width': boxes[:, 2].astype(np.float32),
+        'height': boxes[:, 3].astype(np.float32),
+        'confidence': boxes[:, 4].astype(np.float32),
+    }, columns=DETECTION_COLUMNS)
+
+def _write_labels(frame, output_dir):
+    """ Write YOLO label files (class x y w h conf), one per image with detections. """
+    os.makedirs(output_dir, exist_ok=True)
+    for file_name, rows in frame.groupby('file_name', sort=False):
+        label_path = os.path.join(output_dir, f'{Path(file_name).stem}.txt')
+        values = rows[DETECTION_COLUMNS[1:]].to_numpy()
+        np.savetxt(label_path, values, fmt=['%d', '%.6f', '%.6f', '%.6f', '%.6f', '%.6f'])
+
+def _load(path, imgsz, with_digest, cache=None):
+    """ load_image that always returns (image, digest); digest is None unless with_digest or cached.
+
+    With a PreprocessCache, cached images are memory-mapped instead of decoded.
+    """
+    if cache is None:
+        return load_image(path, imgsz, True) if with_digest else (load_image(path, imgsz), None)
+    try:
+        image, digest = cache.load(path, imgsz, partial(decode_image, imgsz=imgsz))
+        if image is None:
+            log_error(f'Could not decode {path}')
+        return image, digest
+    except Exception as e:
+        log_error(f'Could not load {path}: {e}')
+        return None, None
+
+def _detect_batch(model, paths, loaded, imgsz):
+    """ Run one batch of (image, digest) pairs through the model.
+
+    Returns the detections frame and one (path, status, digest, detections, error) outcome per image.
+    """
+    outcomes = [(p, 'error', digest, 0, 'unreadable image') for p, (image, digest) in zip(paths, loaded) if image is None]
+    decoded = [(p, image, digest) for p, (image, digest) in zip(paths, loaded) if image is not None]
+    if not decoded:
+        return _results_to_frame([], []), outcomes
+    paths, images, digests = map(list, zip(*decoded))
+
+    try:
+        with torch.inference_mode():
+            results = model(images, size=imgsz)
+    except Exception as e:
+        log_error(f'Inference failed for a batch of {len(paths)} images: {e}')
+        return _results_to_frame([], []), outcomes + [(p, 'error', d, 0, str(e)) for p, d in zip(paths, digests)]
+
+    outcomes += [
+        (p, 'detections' if len(boxes) else 'no_detections', d, len(boxes), None)
+        for p, d, boxes in zip(paths, digests, results.xywhn)
+    ]
+    return _results_to_frame(paths, results.xywhn), outcomes
+
+class DetectionWriter:
+    """ Single destination for detection results: YOLO label files, the detection_results table
+    and output_csv (both every flush_rows rows) and the manifest (saved every save_every batches,
+    right after the pending rows are flushed, so images are never marked done before their rows
+    are stored). Rows are appended to output_csv, since a resumed run only holds its own images.
+    """
+
+    def __init__(self, output_dir=None, engine=None, flush_rows=5000, manifest=None, save_every=20,
+                 output_csv=None):
+        self.output_dir = output_dir
+        self.engine = engine
+        self.output_csv = output_csv
+        self.flush_rows = flush_rows
+        self.manifest = manifest
+        self.save_every = max(1, save_every)
+        self.frames = []
+        self.unloaded = []
+        self.batches = 0
+        self.processed = 0
+        self.failed = 0
+
+    def add(self, frame, outcomes):
+        self.batches += 1
+        self.failed += sum(1 for outcome in outcomes if outcome[1] == 'error')
+        self.processed += len(outcomes)
+        if len(frame):
+            self.frames.append(frame)
+            if self.output_dir:
+                _write_labels(frame, self.output_dir)
+            if self.engine is not None or self.output_csv:
+                self.unloaded.append(frame)
+                if sum(len(f) for f in self.unloaded) >= self.flush_rows:
+                    self.flush()
+
+        if self.manifest is not None:
+            for path, status, digest, detections, error in outcomes:
+                self.manifest.record(path, status, digest, detections, error)
+            if self.batches % self.save_every == 0:
+                self.flush()
+                self.manifest.save()
+
+    def flush(self):
+        if not self.unloaded:
+            return
+        pending = pd.concat(self.unloaded, ignore_index=True)
+        if self.output_csv:
+            new_file = not os.path.exists(self.output_csv) or os.path.getsize(self.output_csv) == 0
+            pending.to_csv(self.output_csv, mode='a', header=new_file, index=False)
+        if self.engine is not None:
+            from load_detection_data import bulk_insert_data
+            bulk_insert_data(self.engine, pending)
+        self.unloaded = []
+
+    def close(self):
+        """ Flush what is left, save the manifest and return every detection. """
+        self.flush()
+        if self.manifest is not None:
+            self.manifest.save()
+        return pd.concat(self.frames, ignore_index=True) if self.frames else _results_to_frame([], [])
+
+def _pending_images(image_dir, manifest):
+    images = find_images(image_dir)
+    if manifest is not None:
+        found = len(images)
+        images = manifest.pending(images)
+        log_info(f'{found - len(images)} of {found} images already processed, {len(images)} to go.')
+    return images
+
+def _finish(writer, start_time):
+    detections = writer.close()
+    elapsed = time.perf_counter() - start_time
+    succeeded = writer.processed - writer.failed
+    log_info(f'Detected {len(detections)} objects in {succeeded} images ({writer.failed} failed) '
+             f'in {elapsed:.1f}s ({succeeded / max(elapsed, 1e-9):.1f} images/sec).')
+    return detections
+
+def detect_objects(model, image_dir, output_dir=None, output_csv=None, batch_size=BATCH_SIZE, imgsz=IMAGE_SIZE,
+                   decode_workers=DECODE_WORKERS, torch_threads=TORCH_THREADS, conf_threshold=CONF_THRESHOLD,
+                   engine=None, flush_rows=5000, manifest=None, save_every=20, cache=None):
+    """ Run batched CPU inference over every image under image_dir.
+
+    Images are decoded and resized in a thread pool one batch ahead, so decoding the next batch
+    overlaps with inference on the current one. Detections come back in the detection_results
+    columns; they are also written as YOLO label files to output_dir, appended to output_csv, and
+    (when engine is given) into the detection_results table every flush_rows rows.
+
+    With a DetectionManifest, images already processed (and unchanged) are skipped and every
+    image's outcome is recorded, so a crashed run resumes where it stopped. With a
+    PreprocessCache, images decoded by an earlier run are memory-mapped from disk instead.
+    """
+    torch.set_num_threads(torch_threads or os.cpu_count() or 1)
+    model.conf = conf_threshold
+    images = _pending_images(image_dir, manifest)
+    batches = [images[i:i + batch_size] for i in range(0, len(images), max(1, batch_size))]
+    log_info(f'Detecting objects in {len(images)} images ({len(batches)} batches of {batch_size}, '
+             f'{torch.get_num_threads()} torch threads, {decode_workers} decode threads).')
+
+    writer = DetectionWriter(output_dir, engine, flush_rows, manifest, save_every, output_csv)
+    with_digest = manifest is not None
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, decode_workers)) as pool:
+        upcoming = [pool.submit(_load, p, imgsz, with_digest, cache) for p in batches[0]] if batches else []
+        for i, batch in enumerate(batches):
+            loaded = [future.result() for future in upcoming]
+            if i + 1 < len(batches):
+                upcoming = [pool.submit(_load, p, imgsz, with_digest, cache) for p in batches[i + 1]]  # Prefetch
+
+            writer.add(*_detect_batch(model, batch, loaded, imgsz))
+            if (i + 1) % 50 == 0:
+                elapsed = time.perf_counter() - start_time
+                log_info(f'{writer.processed} images done ({writer.processed / elapsed:.1f} images/sec).')
+
+    if cache is not None:
+        log_info(f'Preprocess cache: {cache.stats()}')
+    return _finish(writer, start_time)
+
+# Model and preprocess cache of a detection worker process, set up once by _init_worker
+_worker_model = None
+_worker_cache = None
+
+def _init_worker(torch_threads, conf_threshold, cache_settings=None):
+    """ Process pool initializer: size the thread pools for this worker and load the model once. """
+    global _worker_model, _worker_cache
+    torch.set_num_threads(torch_threads)
+    cv2.setNumThreads(1)
+    _worker_model = load_yolo_model()
+    _worker_model.conf = conf_threshold
+    _worker_cache = PreprocessCache(*cache_settings) if cache_settings else None
+
+def _detect_shard(paths, imgsz, batch_size, with_digest):
+    """ Worker task: decode and detect one shard of images in batches; returns (frame, outcomes). """
+    frames, outcomes = [], []
+    for start in range(0, len(paths), batch_size):
+        batch = paths[start:start + batch_size]
+        frame, batch_outcomes = _detect_batch(
+            _worker_model, batch, [_load(p, imgsz, with_digest, _worker_cache) for p in batch], imgsz
+        )
+        frames.append(frame)
+        outcomes.extend(batch_outcomes)
+    return pd.concat(frames, ignore_index=True), outcomes
+
+def detect_objects_parallel(image_dir, output_dir=None, output_csv=None, processes=PROCESSES,
+                            threads_per_worker=None, shard_size=SHARD_SIZE, batch_size=BATCH_SIZE,
+                            imgsz=IMAGE_SIZE, conf_threshold=CONF_THRESHOLD, engine=None, flush_rows=5000,
+                            manifest=None, save_every=5, cache=None):
+    """ Run detection on a pool of worker processes, each holding its own copy of the model.
+
+    Workers load the model once at start-up and split the cores between them (threads_per_worker
+    defaults to cores // processes) so their torch thread pools don't oversubscribe the CPU.
+    Image shards of shard_size are queued on the pool and results stream back in completion
+    order to a single DetectionWriter in this process, which owns the label files, the database
+    writes and the manifest. A PreprocessCache is reopened by every worker on the same directory.
+    """
+    cores = os.cpu_count() or 1
+    processes = max(1, processes or cores)
+    threads_per_worker = threads_per_worker or max(1, cores // processes)
+    images = _pending_images(image_dir, manifest)
+    shards = [images[i:i + shard_size] for i in range(0, len(images), max(1, shard_size))]
+    log_info(f'Detecting objects in {len(images)} images ({len(shards)} shards of {shard_size}) '
+             f'on {processes} processes with {threads_per_worker} torch threads each.')
+
+    writer = DetectionWriter(output_dir, engine, flush_rows, manifest, save_every, output_csv)
+    cache_settings = (cache.root, cache.max_bytes) if cache is not None else None
+    task = partial(_detect_shard, imgsz=imgsz, batch_size=max(1, batch_size), with_digest=manifest is not None)
+    start_time = time.perf_counter()
+    # spawn: forking a parent that already started torch/OpenMP threads can deadlock the children
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context, initializer=_init_worker,
+                             initargs=(threads_per_worker, conf_threshold, cache_settings)) as pool:
+        futures = [pool.submit(task, shard) for shard in shards]
+        for i, future in enumerate(as_completed(futures)):
+            writer.add(*future.result())
+            if (i + 1) % 10 == 0:
+                elapsed = time.perf_counter() - start_time
+                log_info(f'{writer.processed} images done ({writer.processed / elapsed:.1f} images/sec).')
+
+    return _finish(writer, start_time)
+
+def _read_texts(paths):
+    texts = []
+    for path in paths:
+        with open(path, 'r') as f:
+            texts.append(f.read().strip())
+    return texts
+
+def _parse_labels(text, columns):
+    """ Parse label text with `columns` numbers per line into an (n, 6) float32 array of
+    class, x, y, w, h, confidence; 5-column labels (no confidence) get NaN confidences.
+    """
+    values = np.fromstring(text, dtype=np.float32, sep=' ') if text else np.empty(0, dtype=np.float32)
+    values = values.reshape(-1, columns)
+    if columns == 5:
+        values = np.column_stack([values, np.full(len(values), np.nan, dtype=np.float32)])
+    return values
+
+def load_yolo_labels(label_dir, workers=8, image_dir=IMAGE_DIR, image_extension='.jpg'):
+    """ Read every YOLO label .txt file in label_dir into one detection_results frame.
+
+    Files are read in a thread pool, then all files with the same column count (5, or 6 with
+    confidence) are joined and parsed by a single NumPy call, so no Python row objects are
+    built and the columns come out typed (int32 class_id, float32 coordinates). file_name is
+    the label's image name as detect_objects stores it, looked up by stem among the images in
+    image_dir; labels without a matching image fall back to their stem plus image_extension.
+    Blank lines inside a label file are ignored.
+    """
+    label_names = sorted(entry.name for entry in os.scandir(label_dir) if entry.name.endswith('.txt'))
+    label_files = [os.path.join(label_dir, name) for name in label_names]
+    # One task per slice of files; a future per file would cost more than reading it
+    slices = [label_files[i:i + 1000] for i in range(0, len(label_files), 1000)]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        texts = [text for texts in pool.map(_read_texts, slices) for text in texts]
+
+    known = {}
+    if image_dir and os.path.isdir(image_dir):
+        known = {Path(p).stem: os.path.basename(p) for p in find_images(image_dir)}
+    image_names = np.array(
+        [known.get(name[:-len('.txt')], name[:-len('.txt')] + image_extension) for name in label_names], dtype=object
+    )
+    rows = np.array([sum(1 for line in text.split('\n') if line.strip()) for text in texts], dtype=np.int64)
+    columns = np.array([len(text.split('\n', 1)[0].split()) if text else 0 for text in texts])
+
+    parsed, owners = [], []
+    for column_count in np.unique(columns[rows > 0]):
+        group = np.flatnonzero((columns == column_count) & (rows > 0))
+        if column_count in (5, 6):
+            try:
+                values = _parse_labels('\n'.join(texts[i] for i in group), column_count)
+            except ValueError:
+                values = None
+            if values is not None and len(values) == rows[group].sum():
+                parsed.append(values)
+                owners.append(np.repeat(group, rows[group]))
+                continue
+        # Malformed files somewhere in the group: parse file by file to find them
+        for i in group:
+            try:
+                values = _parse_labels(texts[i], column_count)
+                if column_count not in (5, 6) or len(values) != rows[i]:
+                    raise ValueError(f'expected {rows[i]} rows of 5 or 6 numbers')
+                parsed.append(values)
+                owners.append(np.full(len(values), i))
+            except Exception as e:
+                log_error(f'Could not parse label file {label_files[i]}: {e}')
+
+    if not parsed:
+        return _results_to_frame([], [])
+    values = np.concatenate(parsed)
+    owners = np.concatenate(owners)
+    order = np.argsort(owners, kind='stable')  # Back to file order
+    values, owners = values[order], owners[order]
+    return pd.DataFrame({
+        'file_name': image_names[owners],
+        'class_id': values[:, 0].astype(np.int32),
+        'x_center': values[:, 1],
+        'y_center': values[:, 2],
+        'width': values[:, 3],
+        'height': values[:, 4],
+        'confidence': values[:, 5],
+    }, columns=DETECTION_COLUMNS)
+
+def _load_media_channels(messages_root, messages_csv_glob):
+    """ Media file name -> channel, from the raw message dataset or else the scraper CSVs. """
+    if os.path.isdir(messages_root):
+        messages = read_dataset(messages_root, MESSAGE_SCHEMA, columns=["Channel Username", "Media Path"])
+    else:
+        paths = sorted(glob.glob(messages_csv_glob))
+        if not paths:
+            return {}
+        messages = pd.concat(
+            [pd.read_csv(p, usecols=["Channel Username", "Media Path"]) for p in paths], ignore_index=True
+        )
+    return media_channels(messages)
+
+def process_the_YOLO_object(path, output_format="csv", parquet_root="../data/raw/detections", image_dir=IMAGE_DIR,
+                            messages_root="../data/raw/messages", messages_csv_glob="../data/*_data.csv"):
+    log_info("Processing the data collected from the YOLO object detection model...")
     try:
-        for filename in os.listdir(path):
-            if filename.endswith('.txt'):
-                filepath = os.path.join(path, filename)
-                with open(filepath, 'r') as f:
-                    lines = f.readlines()
-                    for line in lines:
-                        data = line.strip().split()
-                        class_id = int(data[0])
-                        x_center = float(data[1])
-                        y_center = float(data[2])
-                        width = float(data[3])
-                        height = float(data[4])
-                        confidence = float(data[5])
-                        output_data.append([filename, class_id, x_center, y_center, width, height, confidence])
-       
-        df = pd.DataFrame(output_data, columns=['filename', 'class_id', 'x_center', 'y_center', 'width', 'height', 'confidence'])
-        df.to_csv('YOLO_output_data.csv', index=False)
+        df = load_yolo_labels(path, image_dir=image_dir)
+        log_info(f"Loaded {len(df)} detections from label files in '{path}'.")
+        if output_format == "parquet":
+            # Partitioned by the posting channel (joined through the messages' media paths) and run date
+            channels = _load_media_channels(messages_root, messages_csv_glob)
+            write_detections(df, parquet_root, channels=channels)
+        else:
+            df.to_csv('YOLO_output_data.csv', index=False)
         return df
     except Exception as e:
-        logger.error(f"An error occurred while processing the data: {e}")
+        log_error(f"An error occurred while processing the data: {e}")
 
 def main():
     setup_logging()
     
     try:
-        model = load_yolo_model()
-        detect_objects(model, 'path_to_your_scraped_images', 'detection_results', 'detection_results.csv')
+        manifest = DetectionManifest(MANIFEST_PATH, IMAGE_DIR)
+        cache = PreprocessCache(CACHE_DIR, CACHE_MAX_BYTES) if CACHE_DIR else None
+        if PROCESSES and PROCESSES > 1:
+            detect_objects_parallel(IMAGE_DIR, 'detection_results', 'detection_results.csv',
+                                    manifest=manifest, cache=cache)
+        else:
+            model = load_yolo_model()
+            detect_objects(model, IMAGE_DIR, 'detection_results', 'detection_results.csv',
+                           manifest=manifest, cache=cache)
         log_info('✅ Object detection process completed successfully.')
     except Exception as e:
         log_error(f'Error during object detection: {e}')
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+
+
+class MediaDownloader:
+    """ Pool of download workers draining an asyncio queue of (message, media_path, on_done) jobs.
+
+    The scraper enqueues jobs while it keeps paginating messages, so a slow photo never
+    stalls iter_messages. The bounded queue applies back-pressure when workers fall behind.
+    """
+
+    def __init__(self, client, workers=4, retries=3, retry_delay=2.0, queue_size=200):
+        self.client = client
+        self.workers = max(1, workers)
+        self.retries = max(1, retries)
+        self.retry_delay = retry_delay
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.tasks = []
+        self.downloaded = 0
+        self.failed = 0
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def start(self):
+        """ Spawn the worker tasks. """
+        self.tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def submit(self, message, media_path, on_done=None):
+        """ Queue a download; waits if the queue is full.
+
+        on_done is an optional coroutine function called with (message, media_path, success).
+        """
+        await self.queue.put((message, media_path, on_done))
+
+    async def close(self):
+        """ Wait until every queued job is done, then stop the workers. """
+        await self.queue.join()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        logging.info(f"Media downloads finished: {self.downloaded} downloaded, {self.failed} failed")
+
+    async def _worker(self, worker_id):
+        while True:
+            message, media_path, on_done = await self.queue.get()
+            try:
+                success = await self._download(message, media_path)
+                if on_done:
+                    await on_done(message, media_path, success)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Error handling media for message ID {message.id}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def _download(self, message, media_path):
+        for attempt in range(1, self.retries + 1):
+            try:
+                await self.client.download_media(message.media, media_path)
+                self.downloaded += 1
+                logging.info(f"Downloaded media for message ID {message.id}")
+                return True
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt == self.retries:
+                    self.failed += 1
+                    logging.error(f"Giving up on media for message ID {message.id} after {attempt} attempts: {e}")
+                    return False
+                delay = self.retry_delay * 2 ** (attempt - 1)
+                logging.warning(f"Media download for message ID {message.id} failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
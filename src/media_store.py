@@ -0,0 +1,107 @@
+import os
+import json
+import uuid
+import hashlib
+import logging
+import threading
+
+
+class MediaStore:
+    """ Content-addressed media store.
+
+    Every file is kept once under blobs/<aa>/<sha256>.<ext>, and an index maps Telegram
+    photo/document IDs to those blobs so media that was seen before is never downloaded again.
+    put() runs in worker threads, so the index is only touched under a lock.
+    """
+
+    def __init__(self, root, index_path=None):
+        self.root = root
+        self.blob_dir = os.path.join(root, "blobs")
+        self.tmp_dir = os.path.join(root, "tmp")
+        self.index_path = index_path or os.path.join(root, "media_index.json")
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self.index = self._load()
+        self.hits = 0
+        self.stored = 0
+        self.deduplicated = 0
+
+    def _load(self):
+        try:
+            if not os.path.exists(self.index_path):
+                return {}
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logging.error(f"Error reading media index from {self.index_path}: {e}")
+            return {}
+
+    @staticmethod
+    def media_key(message):
+        """ Stable Telegram identifier of a message's photo or document, or None for other media. """
+        if getattr(message, "photo", None) is not None:
+            return f"photo:{message.photo.id}"
+        if getattr(message, "document", None) is not None:
+            return f"document:{message.document.id}"
+        return None
+
+    def lookup(self, key):
+        """ Return the blob path already stored for a media key, or None. """
+        with self._lock:
+            relative_path = self.index.get(key) if key else None
+            if relative_path is None:
+                return None
+            path = os.path.join(self.root, relative_path)
+            if not os.path.exists(path):
+                self.index.pop(key, None)
+                return None
+            self.hits += 1
+            return path
+
+    def temp_path(self, key, extension):
+        """ Scratch location to download a media file into before it is hashed. """
+        safe_key = key.replace(":", "_")
+        return os.path.join(self.tmp_dir, f"{safe_key}_{uuid.uuid4().hex}.{extension}")
+
+    def put(self, key, tmp_path, extension):
+        """ Move a downloaded file into the store, dropping it if the same content is already there. """
+        digest = self._hash_file(tmp_path)
+        relative_path = os.path.join("blobs", digest[:2], f"{digest}.{extension}")
+        path = os.path.join(self.root, relative_path)
+
+        with self._lock:
+            if os.path.exists(path):
+                os.remove(tmp_path)
+                self.deduplicated += 1
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+                self.stored += 1
+            self.index[key] = relative_path
+        return path
+
+    @staticmethod
+    def _hash_file(path, chunk_size=1 << 20):
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def save(self):
+        """ Write a snapshot of the index atomically. """
+        try:
+            with self._lock:
+                index = dict(self.index)
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(index, f)
+            os.replace(tmp_path, self.index_path)
+            logging.info(
+                f"Media index saved ({len(index)} keys, {self.hits} hits, "
+                f"{self.stored} stored, {self.deduplicated} deduplicated)"
+            )
+        except Exception as e:
+            logging.error(f"Error saving media index to {self.index_path}: {e}")
+            raise
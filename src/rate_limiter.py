@@ -0,0 +1,137 @@
+import asyncio
+import time
+import logging
+from telethon.errors import FloodWaitError
+
+
+class TelegramRateLimiter:
+    """ Central pacing layer for Telegram API calls.
+
+    Every call waits for its slot, FloodWait errors push the next slot out by the requested
+    number of seconds for all callers, and the interval between calls grows on each FloodWait
+    and shrinks again while calls succeed. Works with any client object that exposes
+    get_entity, iter_messages and download_media, so a fake client can drive it in tests.
+    """
+
+    def __init__(self, min_interval=0.0, max_interval=5.0, backoff_factor=2.0, backoff_step=0.5,
+                 recovery_step=0.05, max_retries=5, sleep=asyncio.sleep, clock=time.monotonic):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.backoff_step = backoff_step
+        self.recovery_step = recovery_step
+        self.max_retries = max_retries
+        self.interval = min_interval
+        self._sleep = sleep
+        self._clock = clock
+        self._lock = asyncio.Lock()
+        self._next_slot = 0.0
+
+        # Counters exported through stats()
+        self.calls = 0
+        self.flood_waits = 0
+        self.flood_wait_seconds = 0.0
+        self.throttled_seconds = 0.0
+        self.resumes = 0
+
+    async def _acquire(self):
+        async with self._lock:
+            wait = self._next_slot - self._clock()
+            if wait > 0:
+                self.throttled_seconds += wait
+                await self._sleep(wait)
+            self._next_slot = self._clock() + self.interval
+            self.calls += 1
+
+    def _on_success(self):
+        self.interval = max(self.min_interval, self.interval - self.recovery_step)
+
+    def _on_flood_wait(self, error):
+        seconds = getattr(error, "seconds", 0) or 0
+        self.flood_waits += 1
+        self.flood_wait_seconds += seconds
+        self.interval = min(self.max_interval, max(self.interval * self.backoff_factor, self.backoff_step))
+        # Every caller shares the account's limit, so everyone waits out the FloodWait
+        self._next_slot = max(self._next_slot, self._clock() + seconds)
+        logging.warning(f"FloodWait of {seconds}s, call interval is now {self.interval:.2f}s")
+
+    async def call(self, func, *args, **kwargs):
+        """ Await func(*args, **kwargs) in its slot, retrying after each FloodWait. """
+        for attempt in range(self.max_retries + 1):
+            await self._acquire()
+            try:
+                result = await func(*args, **kwargs)
+            except FloodWaitError as e:
+                if attempt == self.max_retries:
+                    raise
+                self._on_flood_wait(e)
+                continue
+            self._on_success()
+            return result
+
+    async def iter_messages(self, client, entity, limit=None, **kwargs):
+        """ Like client.iter_messages, but a FloodWait resumes after the last yielded message ID. """
+        yielded = 0
+        last_id = None
+        retries = 0
+        while True:
+            remaining = None if limit is None else limit - yielded
+            if remaining is not None and remaining <= 0:
+                return
+
+            params = dict(kwargs)
+            if last_id is not None:
+                # offset_id is exclusive in both directions, so nothing is fetched twice
+                params["offset_id"] = last_id
+            if self.interval:
+                params.setdefault("wait_time", self.interval)
+
+            await self._acquire()
+            try:
+                async for message in client.iter_messages(entity, limit=remaining, **params):
+                    yielded += 1
+                    last_id = message.id
+                    yield message
+            except FloodWaitError as e:
+                retries += 1
+                if retries > self.max_retries:
+                    raise
+                self._on_flood_wait(e)
+                self.resumes += 1
+                logging.info(f"Resuming iter_messages after message ID {last_id}")
+                continue
+            self._on_success()
+            return
+
+    def stats(self):
+        """ Snapshot of the throttling counters. """
+        return {
+            "calls": self.calls,
+            "flood_waits": self.flood_waits,
+            "flood_wait_seconds": round(self.flood_wait_seconds, 3),
+            "throttled_seconds": round(self.throttled_seconds, 3),
+            "resumes": self.resumes,
+            "interval": round(self.interval, 3)
+        }
+
+
+class RateLimitedClient:
+    """ Stand-in for a TelegramClient that routes get_entity, iter_messages and download_media
+    through a TelegramRateLimiter. Everything else is passed through to the wrapped client.
+    """
+
+    def __init__(self, client, limiter):
+        self.client = client
+        self.limiter = limiter
+
+    async def get_entity(self, entity):
+        return await self.limiter.call(self.client.get_entity, entity)
+
+    def iter_messages(self, entity, limit=None, **kwargs):
+        return self.limiter.iter_messages(self.client, entity, limit=limit, **kwargs)
+
+    async def download_media(self, media, path):
+        return await self.limiter.call(self.client.download_media, media, path)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
@@ -0,0 +1,64 @@
+import os
+import json
+import logging
+
+
+class ScrapeState:
+    """ Per-channel high-water marks (last message ID and date) persisted to a JSON file.
+
+    update() only records a pending mark for the channel; it becomes part of the saved state
+    once commit() is called after the channel's rows are safely stored. Concurrent channels
+    share one ScrapeState, so one channel saving never persists another one's unflushed marks.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.channels = self._load()
+        self.pending = {}
+
+    def _load(self):
+        try:
+            if not os.path.exists(self.path):
+                logging.info(f"No scrape state at {self.path}, starting from scratch")
+                return {}
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f).get("channels", {})
+        except Exception as e:
+            logging.error(f"Error reading scrape state from {self.path}: {e}")
+            return {}
+
+    def get_last_id(self, channel_username):
+        """ Return the last ingested message ID for a channel, or 0 if it was never scraped. """
+        return self.channels.get(channel_username, {}).get("last_message_id", 0)
+
+    def update(self, channel_username, message_id, message_date):
+        """ Advance the pending high-water mark of a channel if message_id is newer than it. """
+        pending_id = self.pending.get(channel_username, {}).get("last_message_id", 0)
+        if message_id <= max(self.get_last_id(channel_username), pending_id):
+            return
+        self.pending[channel_username] = {
+            "last_message_id": message_id,
+            "last_message_date": message_date.isoformat() if message_date else None
+        }
+
+    def commit(self, channel_username):
+        """ Make the channel's pending mark part of the state written by save(). """
+        mark = self.pending.pop(channel_username, None)
+        if mark:
+            self.channels[channel_username] = mark
+
+    def discard(self, channel_username):
+        """ Forget the channel's pending mark, e.g. when its rows failed to load. """
+        self.pending.pop(channel_username, None)
+
+    def save(self):
+        """ Write the state atomically so a crash never leaves a half-written file. """
+        try:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"channels": self.channels}, f, indent=4)
+            os.replace(tmp_path, self.path)
+            logging.info(f"Scrape state saved to {self.path}")
+        except Exception as e:
+            logging.error(f"Error saving scrape state to {self.path}: {e}")
+            raise
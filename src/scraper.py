@@ -1,9 +1,15 @@
 from telethon import TelegramClient
-import csv
+import asyncio
 import os
+import time
 import logging
 import json
 from dotenv import load_dotenv
+from scrape_state import ScrapeState
+from media_downloader import MediaDownloader
+from media_store import MediaStore
+from rate_limiter import TelegramRateLimiter, RateLimitedClient
+from sinks import CsvSink, ParquetSink, PostgresSink, get_postgres_engine
 
 # 🔹 Set up Logging
 LOG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scraping.log")
@@ -32,11 +38,28 @@ ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # Root f
 CHANNELS_FILE = os.path.join(ROOT_DIR, "channels.json")
 DATA_DIR = os.path.join(ROOT_DIR, "data")
 MEDIA_DIR = os.path.join(ROOT_DIR, "photos")
+PARQUET_DIR = os.path.join(DATA_DIR, "raw", "messages")
+STATE_FILE = os.getenv("SCRAPE_STATE_FILE", os.path.join(DATA_DIR, "scrape_state.json"))
 
 # 🔹 Ensure directories exist
 os.makedirs(DATA_DIR, exist_ok=True)
 os.makedirs(MEDIA_DIR, exist_ok=True)
 
+# 🔹 Scraping settings (can be overridden from the .env file)
+NUM_MESSAGES_TO_SCRAPE = int(os.getenv("SCRAPE_NUM_MESSAGES", 4000))  # Messages per channel
+MAX_CONCURRENT_CHANNELS = int(os.getenv("SCRAPE_MAX_CONCURRENCY", 3))  # Channels scraped at the same time
+PROGRESS_EVERY = int(os.getenv("SCRAPE_PROGRESS_EVERY", 500))  # Log progress every N messages
+MEDIA_WORKERS = int(os.getenv("SCRAPE_MEDIA_WORKERS", 4))  # Parallel media downloads per channel
+MEDIA_RETRIES = int(os.getenv("SCRAPE_MEDIA_RETRIES", 3))  # Attempts per media file
+MIN_CALL_INTERVAL = float(os.getenv("SCRAPE_MIN_CALL_INTERVAL", 0))  # Seconds between Telegram API calls
+MAX_CALL_INTERVAL = float(os.getenv("SCRAPE_MAX_CALL_INTERVAL", 5))  # Upper bound for adaptive backoff
+FLOOD_WAIT_RETRIES = int(os.getenv("SCRAPE_FLOOD_WAIT_RETRIES", 5))  # FloodWaits tolerated per call
+SINK = os.getenv("SCRAPE_SINK", "csv")  # "csv", "parquet" (PARQUET_DIR) or "postgres" (streams to the DB)
+FLUSH_SIZE = int(os.getenv("SCRAPE_FLUSH_SIZE", 500))  # Rows per micro-batch for the postgres sink
+FLUSH_INTERVAL = float(os.getenv("SCRAPE_FLUSH_INTERVAL", 5))  # Max seconds a row waits before being flushed
+MAX_PENDING_BATCHES = int(os.getenv("SCRAPE_MAX_PENDING_BATCHES", 2))  # Batches loading before scraping waits
+PARQUET_FLUSH_SIZE = int(os.getenv("SCRAPE_PARQUET_FLUSH_SIZE", 5000))  # Rows per Parquet write
+
 # 🔹 Function to load channels from JSON
 def load_channels_from_json(file_path):
     try:
@@ -52,35 +75,142 @@ def load_channels_from_json(file_path):
         return [], []
 
 # 🔹 Function to scrape data from a single channel
-async def scrape_channel(client, channel_username, writer, media_dir, num_messages):
+async def scrape_channel(client, channel_username, sink, media_dir, num_messages, state=None, downloader=None,
+                         store=None):
+    """ Scrape up to num_messages from a channel and return how many were processed.
+
+    When a ScrapeState is given, only messages newer than the channel's high-water mark are fetched.
+    When a MediaDownloader is given, media is queued for its workers instead of downloaded inline.
+    When a MediaStore is given, known media is reused and new media is saved as a content-addressed blob.
+    """
+    message_count = 0
+    last_id = 0
     try:
         logging.info(f"Fetching entity for: {channel_username}")
         entity = await client.get_entity(channel_username)
         channel_title = entity.title
-        message_count = 0
 
-        async for message in client.iter_messages(entity, limit=num_messages):
+        last_id = state.get_last_id(channel_username) if state else 0
+        if last_id:
+            # Incremental run: walk forward (oldest first) from the last ingested message
+            logging.info(f"Resuming {channel_username} after message ID {last_id}")
+            messages = client.iter_messages(entity, limit=num_messages, min_id=last_id, reverse=True)
+        else:
+            # First run: backfill the newest num_messages
+            messages = client.iter_messages(entity, limit=num_messages)
+
+        async def write_stored_row(message, tmp_path, success):
+            # The blob path is only known once the file has been hashed, so these rows are written late
+            # The message's mark is already advanced, so the row is written even if storing the media fails
+            media_path = None
+            try:
+                if success and os.path.exists(tmp_path):
+                    extension = os.path.splitext(tmp_path)[1].lstrip(".")
+                    media_path = await asyncio.to_thread(store.put, MediaStore.media_key(message), tmp_path, extension)
+            except Exception as e:
+                logging.error(f"Error storing media for message ID {message.id}: {e}")
+            await sink.write([channel_title, channel_username, message.id, message.message, message.date, media_path])
+            logging.info(f"Processed message ID {message.id} from {channel_username}")
+
+        async for message in messages:
             media_path = None
+            deferred = False
             if message.media:
                 file_extension = "jpg"
                 if hasattr(message.media, "document"):
                     file_extension = message.media.document.mime_type.split("/")[-1]
 
-                filename = f"{channel_username}_{message.id}.{file_extension}"
-                media_path = os.path.join(media_dir, filename)
-                await client.download_media(message.media, media_path)
-                logging.info(f"Downloaded media for message ID {message.id}")
+                media_key = MediaStore.media_key(message) if store else None
+                media_path = store.lookup(media_key) if media_key else None
 
-            writer.writerow([channel_title, channel_username, message.id, message.message, message.date, media_path])
-            logging.info(f"Processed message ID {message.id} from {channel_username}")
+                if media_path:
+                    logging.info(f"Media for message ID {message.id} already stored at {media_path}")
+                elif media_key and downloader:
+                    await downloader.submit(message, store.temp_path(media_key, file_extension), write_stored_row)
+                    deferred = True
+                elif media_key:
+                    tmp_path = store.temp_path(media_key, file_extension)
+                    await client.download_media(message.media, tmp_path)
+                    media_path = await asyncio.to_thread(store.put, media_key, tmp_path, file_extension)
+                    logging.info(f"Downloaded media for message ID {message.id}")
+                else:
+                    filename = f"{channel_username}_{message.id}.{file_extension}"
+                    media_path = os.path.join(media_dir, filename)
+                    if downloader:
+                        await downloader.submit(message, media_path)
+                    else:
+                        await client.download_media(message.media, media_path)
+                        logging.info(f"Downloaded media for message ID {message.id}")
+
+            if not deferred:
+                await sink.write([channel_title, channel_username, message.id, message.message, message.date, media_path])
+                logging.info(f"Processed message ID {message.id} from {channel_username}")
+            if state:
+                state.update(channel_username, message.id, message.date)
 
             message_count += 1
-        
+            if message_count % PROGRESS_EVERY == 0:
+                logging.info(f"Progress {channel_username}: {message_count}/{num_messages} messages")
+                print(f"⏳ {channel_username}: {message_count}/{num_messages} messages")
+
         if message_count == 0:
             logging.info(f"No messages found for {channel_username}")
 
     except Exception as e:
         logging.error(f"Error scraping {channel_username}: {e}")
+        if state and not last_id:
+            # A first run walks newest to oldest, so its mark is only safe once the backfill finished;
+            # keeping it would make every later run skip the older messages that were never fetched
+            state.discard(channel_username)
+
+    return message_count
+
+# 🔹 Function to create the output sink of a channel
+def open_sink(channel_username, engine=None):
+    """ Return the sink selected by SCRAPE_SINK; the CSV sink writes DATA_DIR/<channel>_data.csv. """
+    if engine is not None:
+        return PostgresSink(
+            engine, flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL, max_pending=MAX_PENDING_BATCHES
+        )
+    if SINK == "parquet":
+        return ParquetSink(PARQUET_DIR, flush_size=PARQUET_FLUSH_SIZE)
+    csv_filename = os.path.join(DATA_DIR, f"{channel_username[1:]}_data.csv")  # Remove '@' from channel name
+    return CsvSink(csv_filename)
+
+# 🔹 Function to scrape a channel into its own sink, bounded by a shared semaphore
+async def scrape_channel_to_sink(client, channel_username, semaphore, num_messages, state=None, store=None,
+                                 engine=None):
+    """ Scrape one channel into its sink and return (channel, count, seconds). """
+    async with semaphore:
+        print(f"📥 Processing channel: {channel_username}")
+        start_time = time.perf_counter()
+
+        sink = open_sink(channel_username, engine)
+        try:
+            # Rows are written as soon as metadata arrives; media is fetched by the worker pool
+            async with MediaDownloader(client, workers=MEDIA_WORKERS, retries=MEDIA_RETRIES) as downloader:
+                message_count = await scrape_channel(
+                    client, channel_username, sink, MEDIA_DIR, num_messages, state, downloader, store
+                )
+        finally:
+            try:
+                await sink.close()
+            except Exception:
+                if state:
+                    state.discard(channel_username)
+                raise
+
+        # Persist the high-water mark only once the rows are safely stored
+        if state and message_count:
+            state.commit(channel_username)
+            state.save()
+        if store and message_count:
+            store.save()
+
+        elapsed = time.perf_counter() - start_time
+        logging.info(f"Scraped {message_count} messages from {channel_username} in {elapsed:.1f}s")
+        print(f"✅ Scraped {message_count} messages from {channel_username} in {elapsed:.1f}s.")
+        return channel_username, message_count, elapsed
 
 # 🔹 Initialize the Telegram Client
 client = TelegramClient("scraping_session", api_id, api_hash)
@@ -99,18 +229,41 @@ async def main():
             print("❌ No channels found to scrape.")
             return
 
-        num_messages_to_scrape = 4000  # Number of messages to scrape
-
-        for channel in channels:
-            print(f"📥 Processing channel: {channel}")
+        # Scrape channels concurrently over the same client, at most MAX_CONCURRENT_CHANNELS at a time
+        print(f"🚀 Scraping {len(channels)} channels with concurrency {MAX_CONCURRENT_CHANNELS}")
+        run_start = time.perf_counter()
+        semaphore = asyncio.Semaphore(max(1, MAX_CONCURRENT_CHANNELS))
+        state = ScrapeState(STATE_FILE)
+        store = MediaStore(MEDIA_DIR)
+        limiter = TelegramRateLimiter(
+            min_interval=MIN_CALL_INTERVAL, max_interval=MAX_CALL_INTERVAL, max_retries=FLOOD_WAIT_RETRIES
+        )
+        limited_client = RateLimitedClient(client, limiter)
+        engine = get_postgres_engine() if SINK == "postgres" else None
+        print(f"🗄️ Writing scraped messages to the {SINK} sink")
+        results = await asyncio.gather(
+            *(
+                scrape_channel_to_sink(
+                    limited_client, channel, semaphore, NUM_MESSAGES_TO_SCRAPE, state, store, engine
+                )
+                for channel in channels
+            ),
+            return_exceptions=True
+        )
 
-            csv_filename = os.path.join(DATA_DIR, f"{channel[1:]}_data.csv")  # Remove '@' from channel name
-            with open(csv_filename, "a", newline="", encoding="utf-8") as file:
-                writer = csv.writer(file)
-                writer.writerow(["Channel Title", "Channel Username", "ID", "Message", "Date", "Media Path"])
+        total_messages = 0
+        for channel, result in zip(channels, results):
+            if isinstance(result, Exception):
+                logging.error(f"Channel {channel} failed: {result}")
+                print(f"❌ {channel} failed: {result}")
+                continue
+            total_messages += result[1]
 
-                await scrape_channel(client, channel, writer, MEDIA_DIR, num_messages_to_scrape)
-                print(f"✅ Scraped data from {channel}.")
+        run_elapsed = time.perf_counter() - run_start
+        logging.info(f"Scraped {total_messages} messages from {len(channels)} channels in {run_elapsed:.1f}s")
+        print(f"🏁 Scraped {total_messages} messages from {len(channels)} channels in {run_elapsed:.1f}s.")
+        logging.info(f"Rate limiter stats: {limiter.stats()}")
+        print(f"🚦 Rate limiter stats: {limiter.stats()}")
 
         # Log commented channels if needed
         if comments:
@@ -124,5 +277,4 @@ async def main():
         print("🔴 Disconnected from Telegram.")
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(main())
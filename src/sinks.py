@@ -0,0 +1,155 @@
+import os
+import sys
+import csv
+import time
+import asyncio
+import logging
+import pandas as pd
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS_DIR = os.path.join(ROOT_DIR, "scripts")
+if SCRIPTS_DIR not in sys.path:
+    sys.path.append(SCRIPTS_DIR)
+
+from parquet_store import write_messages
+
+CSV_HEADER = ["Channel Title", "Channel Username", "ID", "Message", "Date", "Media Path"]
+
+
+def _load_pipeline_modules():
+    """ Import the cleaning and database scripts on first use.
+
+    They configure logging when imported, so importing them lazily keeps the scraper's own
+    log file in charge when the CSV sink is used.
+    """
+    import database
+    from DataCleaningTransformation import DataCleaning
+    return database, DataCleaning
+
+
+def get_postgres_engine():
+    """ Connect to PostgreSQL and make sure telegram_messages exists. """
+    database, _ = _load_pipeline_modules()
+    engine = database.get_db_connection()
+    database.create_table(engine)
+    return engine
+
+
+class CsvSink:
+    """ Appends scraped rows to a channel CSV file, writing the header only for a new file. """
+
+    def __init__(self, path):
+        self.path = path
+        write_header = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "a", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        if write_header:
+            self.writer.writerow(CSV_HEADER)
+
+    async def write(self, row):
+        self.writer.writerow(row)
+
+    async def close(self):
+        self.file.close()
+
+
+class ParquetSink:
+    """ Buffers scraped rows and appends them to the Parquet message dataset
+    (<root>/channel=<name>/date=<YYYY-MM-DD>/part-*.parquet), one file per partition and flush.
+    """
+
+    def __init__(self, root, flush_size=5000):
+        self.root = root
+        self.flush_size = max(1, flush_size)
+        self.buffer = []
+
+    async def write(self, row):
+        self.buffer.append(row)
+        if len(self.buffer) >= self.flush_size:
+            await self.flush()
+
+    async def flush(self):
+        if not self.buffer:
+            return
+        rows, self.buffer = self.buffer, []
+        await asyncio.to_thread(write_messages, pd.DataFrame(rows, columns=CSV_HEADER), self.root)
+
+    async def close(self):
+        await self.flush()
+
+
+class PostgresSink:
+    """ Cleans scraped rows in micro-batches and loads them straight into telegram_messages.
+
+    A batch is flushed when it reaches flush_size rows or flush_interval seconds have passed.
+    At most max_pending batches are loaded at the same time; once that many are in flight,
+    write() waits, which slows the scraper down to the speed of the database.
+    """
+
+    def __init__(self, engine, flush_size=500, flush_interval=5.0, max_pending=2):
+        self.database, data_cleaning_class = _load_pipeline_modules()
+        self.data_cleaning = data_cleaning_class()
+        self.engine = engine
+        self.flush_size = max(1, flush_size)
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.pending = set()
+        self.slots = asyncio.Semaphore(max(1, max_pending))
+        self.rows_loaded = 0
+        self.errors = []
+        self.timer = asyncio.create_task(self._flush_periodically()) if flush_interval else None
+
+    async def write(self, row):
+        self.buffer.append(row)
+        if len(self.buffer) >= self.flush_size:
+            await self.flush()
+
+    async def flush(self):
+        """ Hand the buffered rows to a background load, waiting for a free slot first.
+
+        The rows stay in the buffer until a slot is free, so a flush cancelled while waiting
+        (the timer on close()) leaves them for the next flush instead of dropping them.
+        """
+        if not self.buffer:
+            return
+        await self.slots.acquire()
+        if not self.buffer:  # Taken by a concurrent flush while waiting
+            self.slots.release()
+            return
+        rows, self.buffer = self.buffer, []
+        task = asyncio.create_task(self._load(rows))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    async def close(self):
+        """ Flush what is left and wait for every load; raises if any batch failed. """
+        if self.timer:
+            self.timer.cancel()
+            await asyncio.gather(self.timer, return_exceptions=True)
+        await self.flush()
+        await asyncio.gather(*list(self.pending), return_exceptions=True)
+        if self.errors:
+            raise RuntimeError(f"{len(self.errors)} batch(es) failed to load: {self.errors[0]}")
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def _load(self, rows):
+        try:
+            start_time = time.perf_counter()
+            loaded = await asyncio.to_thread(self._clean_and_insert, rows)
+            self.rows_loaded += loaded
+            logging.info(f"Streamed {loaded} messages to PostgreSQL in {time.perf_counter() - start_time:.2f}s")
+        except Exception as e:
+            logging.error(f"Error streaming batch of {len(rows)} messages: {e}")
+            self.errors.append(e)
+        finally:
+            self.slots.release()
+
+    def _clean_and_insert(self, rows):
+        df = pd.DataFrame(rows, columns=CSV_HEADER)
+        cleaned_df = self.data_cleaning.clean_dataframe(df)
+        # Micro-batches are too small to pay for bulk_insert_data's staging table on every flush
+        return self.database.insert_records(self.engine, cleaned_df)
@@ -0,0 +1,116 @@
+import os
+import sys
+import asyncio
+from types import SimpleNamespace
+from telethon.errors import FloodWaitError
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from rate_limiter import TelegramRateLimiter, RateLimitedClient
+
+
+class FakeClock:
+    """ Clock and sleep for the limiter; sleeping just moves time forward. """
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeClient:
+    """ Serves messages newest first like Telethon and raises a FloodWait on chosen calls. """
+
+    def __init__(self, message_ids, flood_after=None, entity_flood_waits=0, seconds=3):
+        self.message_ids = message_ids
+        self.flood_after = flood_after  # Raise once, after yielding this many messages
+        self.entity_flood_waits = entity_flood_waits
+        self.seconds = seconds
+        self.iter_calls = []
+        self.entity_calls = 0
+
+    async def get_entity(self, entity):
+        self.entity_calls += 1
+        if self.entity_calls <= self.entity_flood_waits:
+            raise FloodWaitError(request=None, capture=self.seconds)
+        return SimpleNamespace(title=entity)
+
+    async def iter_messages(self, entity, limit=None, offset_id=0, **kwargs):
+        self.iter_calls.append({"limit": limit, "offset_id": offset_id, **kwargs})
+        ids = [i for i in self.message_ids if not offset_id or i < offset_id][:limit]
+        for count, message_id in enumerate(ids):
+            if self.flood_after is not None and count == self.flood_after:
+                self.flood_after = None
+                raise FloodWaitError(request=None, capture=self.seconds)
+            yield SimpleNamespace(id=message_id)
+
+
+def make_limiter(**kwargs):
+    clock = FakeClock()
+    return TelegramRateLimiter(sleep=clock.sleep, clock=clock, **kwargs), clock
+
+
+async def collect(messages):
+    return [message.id async for message in messages]
+
+
+def test_flood_wait_is_waited_out_and_retried():
+    limiter, clock = make_limiter(max_retries=3)
+    client = RateLimitedClient(FakeClient([], entity_flood_waits=2, seconds=3), limiter)
+
+    entity = asyncio.run(client.get_entity("@channel"))
+
+    assert entity.title == "@channel"
+    assert client.client.entity_calls == 3
+    assert sum(clock.sleeps) >= 6  # Two FloodWaits of 3 seconds
+    stats = limiter.stats()
+    assert stats["calls"] == 3
+    assert stats["flood_waits"] == 2
+    assert stats["flood_wait_seconds"] == 6
+    assert stats["interval"] > 0  # Backed off after the FloodWaits
+
+
+def test_flood_wait_gives_up_after_max_retries():
+    limiter, _ = make_limiter(max_retries=1)
+    client = RateLimitedClient(FakeClient([], entity_flood_waits=5), limiter)
+
+    try:
+        asyncio.run(client.get_entity("@channel"))
+    except FloodWaitError:
+        pass
+    else:
+        raise AssertionError("FloodWaitError was not raised")
+    assert limiter.stats()["calls"] == 2
+
+
+def test_iter_messages_resumes_from_offset_id_after_flood_wait():
+    limiter, clock = make_limiter()
+    fake = FakeClient(list(range(10, 0, -1)), flood_after=4, seconds=2)
+    client = RateLimitedClient(fake, limiter)
+
+    ids = asyncio.run(collect(client.iter_messages("@channel", limit=8)))
+
+    assert ids == [10, 9, 8, 7, 6, 5, 4, 3]  # Nothing fetched twice or skipped
+    assert fake.iter_calls[1]["offset_id"] == 7
+    assert fake.iter_calls[1]["limit"] == 4
+    assert 2 in clock.sleeps
+    stats = limiter.stats()
+    assert stats["resumes"] == 1
+    assert stats["flood_waits"] == 1
+
+
+def test_interval_recovers_while_calls_succeed():
+    limiter, _ = make_limiter(min_interval=0.0, backoff_step=0.5, recovery_step=0.25, max_retries=2)
+    client = RateLimitedClient(FakeClient([], entity_flood_waits=1), limiter)
+
+    asyncio.run(client.get_entity("@channel"))  # One FloodWait, then success
+    backed_off = limiter.interval
+    asyncio.run(client.get_entity("@channel"))
+
+    assert limiter.interval == max(0.0, backed_off - 0.25)